@@ -0,0 +1,122 @@
+"""Streaming ZIP archives built on the fly from files on disk."""
+
+import io
+import logging
+import os
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, NamedTuple, Optional
+
+ZIP_CHUNK_SIZE = 256 * 1024
+# Upcoming files are opened and their first chunk read while the current one streams
+ZIP_PREFETCH_FILES = int(os.getenv("ZIP_PREFETCH_FILES", "4"))
+# Earliest timestamp the ZIP format can represent
+ZIP_EPOCH = datetime(1980, 1, 1)
+
+logger = logging.getLogger(__name__)
+
+
+class ArchiveEntry(NamedTuple):
+    arcname: str
+    path: str
+    modified: Optional[datetime] = None
+
+
+class _StreamBuffer(io.RawIOBase):
+    """Unseekable sink for ZipFile; bytes are handed out via drain()."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        return len(b)
+
+    def drain(self) -> Iterator[bytes]:
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks.clear()
+            yield data
+
+
+def unique_arcnames(names: Iterable[str]) -> Iterator[str]:
+    """Make archive names safe and unique: "a.jpg", "a (2).jpg", ..."""
+    seen = set()
+    for name in names:
+        name = os.path.basename(name.replace("\\", "/")) or "file"
+        stem, dot, ext = name.rpartition(".")
+        if not dot:
+            stem, ext = name, ""
+        candidate, n = name, 1
+        while candidate.lower() in seen:
+            n += 1
+            candidate = f"{stem} ({n}){dot}{ext}"
+        seen.add(candidate.lower())
+        yield candidate
+
+
+def _open_with_head(path: str):
+    f = open(path, "rb")
+    try:
+        st = os.fstat(f.fileno())
+        head = f.read(ZIP_CHUNK_SIZE)
+    except OSError:
+        f.close()
+        raise
+    return f, st, head
+
+
+def stream_zip(entries: Iterable[ArchiveEntry]) -> Iterator[bytes]:
+    """Yield a ZIP archive of `entries` using stored (uncompressed) members.
+
+    Nothing is buffered beyond one chunk per in-flight file, and no temp
+    file is written: sizes and CRCs go into data descriptors after each
+    member. Files that disappear before being read are skipped.
+    """
+    buf = _StreamBuffer()
+    pending = deque()
+    source = iter(entries)
+
+    def submit_next(pool):
+        entry = next(source, None)
+        if entry is not None:
+            pending.append((entry, pool.submit(_open_with_head, entry.path)))
+
+    with ThreadPoolExecutor(max_workers=max(ZIP_PREFETCH_FILES, 1)) as pool:
+        try:
+            with zipfile.ZipFile(buf, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+                for _ in range(max(ZIP_PREFETCH_FILES, 1)):
+                    submit_next(pool)
+                while pending:
+                    entry, future = pending.popleft()
+                    submit_next(pool)
+                    try:
+                        f, st, head = future.result()
+                    except OSError as e:
+                        logger.warning("Skipping %s in archive: %s", entry.path, e)
+                        continue
+
+                    modified = max(entry.modified or datetime.fromtimestamp(st.st_mtime), ZIP_EPOCH)
+                    info = zipfile.ZipInfo(entry.arcname, date_time=modified.timetuple()[:6])
+                    info.compress_type = zipfile.ZIP_STORED
+                    info.file_size = st.st_size  # lets ZipFile decide on zip64 up front
+                    with f, zf.open(info, "w") as member:
+                        chunk = head
+                        while chunk:
+                            member.write(chunk)
+                            yield from buf.drain()
+                            chunk = f.read(ZIP_CHUNK_SIZE)
+            yield from buf.drain()  # central directory
+        finally:
+            # Close files opened ahead if the client went away mid-stream
+            for _, future in pending:
+                if not future.cancel():
+                    try:
+                        future.result()[0].close()
+                    except OSError:
+                        pass
@@ -0,0 +1,419 @@
+"""Consistent, incremental backups of the database and the photo store.
+
+Usage:
+    python backup.py snapshot [--dest /backups] [--jobs 8] [--no-verify]
+    python backup.py verify [--dest /backups] [--snapshot ID] [--full]
+    python backup.py restore --target DIR [--dest /backups] [--snapshot ID]
+
+Layout under --dest:
+
+    objects/ab/abcdef...            photo files named by sha256, shared by all snapshots
+    snapshots/<id>/db.dump          pg_dump custom format (db.sqlite3 for SQLite)
+    snapshots/<id>/manifest.json    filename -> sha256/size/mtime, written last
+
+The dump and the list of files come from the same DB snapshot, so every
+file a restored row refers to is part of the backup. A file is only read
+when it is new or its size, mtime or row `updated_at` changed since the
+previous manifest; everything else reuses the recorded hash, so a nightly
+run costs one stat() per file plus the new uploads.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import create_engine, make_url, select, text
+
+from models import Photo
+
+logger = logging.getLogger(__name__)
+
+BACKUP_DIR = os.getenv("BACKUP_DIR", "/backups")
+BACKUP_JOBS = int(os.getenv("BACKUP_JOBS", "8"))
+PG_DUMP_BIN = os.getenv("PG_DUMP_BIN", "pg_dump")
+CHUNK_SIZE = 1024 * 1024
+MANIFEST = "manifest.json"
+
+
+class BackupError(Exception):
+    pass
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def object_path(dest: str, digest: str) -> str:
+    return os.path.join(dest, "objects", digest[:2], digest)
+
+
+def store_object(dest: str, src: str) -> Tuple[str, bool]:
+    """Copy `src` into the object store, hashing while copying.
+
+    Returns (sha256, written); written is False when an identical object
+    was already stored.
+    """
+    tmp_dir = os.path.join(dest, "objects", "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    digest = hashlib.sha256()
+    fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+    try:
+        with open(src, "rb") as f, os.fdopen(fd, "wb") as out:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+            out.flush()
+            os.fsync(out.fileno())
+        target = object_path(dest, digest.hexdigest())
+        if os.path.exists(target):
+            os.remove(tmp_path)
+            return digest.hexdigest(), False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        os.replace(tmp_path, target)
+        return digest.hexdigest(), True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _photo_rows(conn) -> list:
+    return conn.execute(
+        select(Photo.filename, Photo.playback_filename, Photo.poster_filename, Photo.updated_at)
+        .where(Photo.deleted_at.is_(None))
+    ).all()
+
+
+def dump_database(database_url: str, snapshot_dir: str) -> Tuple[dict, list]:
+    """Dump the DB into `snapshot_dir`; returns (dump info, photo rows seen by the dump)."""
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        path = os.path.join(snapshot_dir, "db.sqlite3")
+        src, dst = sqlite3.connect(url.database), sqlite3.connect(path)
+        try:
+            src.backup(dst)
+        finally:
+            src.close()
+            dst.close()
+        engine = create_engine(f"sqlite:///{path}")
+        try:
+            with engine.connect() as conn:
+                rows = _photo_rows(conn)
+        finally:
+            engine.dispose()
+        return {"file": "db.sqlite3", "format": "sqlite"}, rows
+
+    if url.get_backend_name() != "postgresql":
+        raise BackupError(f"Unsupported database: {url.get_backend_name()}")
+    path = os.path.join(snapshot_dir, "db.dump")
+    dsn = url.set(drivername="postgresql", password=None).render_as_string(hide_password=False)
+    env = dict(os.environ, **({"PGPASSWORD": url.password} if url.password else {}))
+    engine = create_engine(database_url)
+    try:
+        with engine.connect().execution_options(isolation_level="REPEATABLE READ") as conn:
+            with conn.begin():
+                # pg_dump joins this transaction's snapshot, so the dump and
+                # the file list below see exactly the same rows
+                snapshot = conn.execute(text("SELECT pg_export_snapshot()")).scalar_one()
+                rows = _photo_rows(conn)
+                result = subprocess.run(
+                    [PG_DUMP_BIN, "--format=custom", f"--snapshot={snapshot}", "--file", path, "--dbname", dsn],
+                    env=env, capture_output=True, text=True,
+                )
+    finally:
+        engine.dispose()
+    if result.returncode != 0:
+        raise BackupError(f"pg_dump failed: {result.stderr.strip()}")
+    return {"file": "db.dump", "format": "pg_dump"}, rows
+
+
+def photo_files(rows: list) -> Dict[str, Optional[str]]:
+    """filename -> row updated_at (ISO) for every file referenced by `rows`."""
+    files = {}
+    for filename, playback, poster, updated_at in rows:
+        stamp = updated_at.isoformat() if updated_at else None
+        for name in (filename, playback, poster):
+            if name:
+                files[name] = stamp
+    return files
+
+
+def list_snapshots(dest: str) -> List[str]:
+    """Ids of complete snapshots (those with a manifest), oldest first."""
+    root = os.path.join(dest, "snapshots")
+    if not os.path.isdir(root):
+        return []
+    return sorted(s for s in os.listdir(root) if os.path.exists(os.path.join(root, s, MANIFEST)))
+
+
+def load_manifest(dest: str, snapshot_id: Optional[str] = None) -> Optional[dict]:
+    """The given snapshot's manifest, or the latest one; None if there are none."""
+    if snapshot_id is None:
+        snapshots = list_snapshots(dest)
+        if not snapshots:
+            return None
+        snapshot_id = snapshots[-1]
+    path = os.path.join(dest, "snapshots", snapshot_id, MANIFEST)
+    if not os.path.exists(path):
+        raise BackupError(f"Snapshot not found: {snapshot_id}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path: str, data: dict):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=1, sort_keys=True)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def create_snapshot(
+    database_url: str, photos_dir: str, dest: str, jobs: int = BACKUP_JOBS, verify: bool = True
+) -> dict:
+    """Dump the DB and copy new or changed photo files; returns the manifest.
+
+    The manifest also carries run statistics under "stats". Files the DB
+    refers to but which are missing on disk are listed there, not fatal.
+    """
+    previous = load_manifest(dest)
+    previous_files = previous["files"] if previous else {}
+    now = datetime.now(timezone.utc)
+    snapshot_id = now.strftime("%Y%m%dT%H%M%S%fZ")
+    snapshot_dir = os.path.join(dest, "snapshots", snapshot_id)
+    os.makedirs(snapshot_dir)
+
+    try:
+        database, rows = dump_database(database_url, snapshot_dir)
+        database["sha256"] = file_digest(os.path.join(snapshot_dir, database["file"]))
+        files = photo_files(rows)
+
+        def backup_file(name: str):
+            path = os.path.join(photos_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                return name, None, False
+            entry = {"size": st.st_size, "mtime": st.st_mtime_ns, "updated_at": files[name]}
+            old = previous_files.get(name)
+            unchanged = old and all(old[key] == entry[key] for key in ("size", "mtime", "updated_at"))
+            if unchanged and os.path.exists(object_path(dest, old["sha256"])):
+                return name, dict(entry, sha256=old["sha256"]), False
+            digest, written = store_object(dest, path)
+            return name, dict(entry, sha256=digest), written
+
+        manifest_files, written, missing = {}, [], []
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            for name, entry, was_written in pool.map(backup_file, sorted(files)):
+                if entry is None:
+                    missing.append(name)
+                    continue
+                manifest_files[name] = entry
+                if was_written:
+                    written.append(name)
+        if missing:
+            logger.warning("%d referenced files are missing from %s", len(missing), photos_dir)
+
+        manifest = {
+            "id": snapshot_id,
+            "created_at": now.isoformat(),
+            "previous": previous["id"] if previous else None,
+            "database": database,
+            "files": manifest_files,
+            "stats": {
+                "files": len(manifest_files),
+                "copied": len(written),
+                "reused": len(manifest_files) - len(written),
+                "bytes_copied": sum(manifest_files[n]["size"] for n in written),
+                "missing": missing,
+            },
+        }
+        if verify:
+            problems = verify_snapshot(dest, manifest, rehash=set(written))
+            if problems:
+                raise BackupError(f"Verification failed: {problems[:10]}")
+        # The manifest is written last, so an interrupted run leaves no snapshot behind
+        _write_json(os.path.join(snapshot_dir, MANIFEST), manifest)
+    except BaseException:
+        # Copied objects stay; the next run reuses them or prune removes them
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+        raise
+    return manifest
+
+
+def verify_snapshot(dest: str, manifest: dict, rehash=None, jobs: int = BACKUP_JOBS) -> List[str]:
+    """Check a snapshot's objects; returns a list of problems (empty when intact).
+
+    Every object must exist with the recorded size. Objects named in
+    `rehash` (all of them when `rehash` is True) are also re-read and
+    their sha256 compared.
+    """
+    problems = []
+    db_path = os.path.join(dest, "snapshots", manifest["id"], manifest["database"]["file"])
+    if not os.path.exists(db_path):
+        problems.append(f"database dump missing: {manifest['database']['file']}")
+    elif rehash is True and file_digest(db_path) != manifest["database"]["sha256"]:
+        problems.append(f"database dump corrupt: {manifest['database']['file']}")
+
+    to_hash = {}
+    for name, entry in manifest["files"].items():
+        path = object_path(dest, entry["sha256"])
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            problems.append(f"object missing: {name}")
+            continue
+        if size != entry["size"]:
+            problems.append(f"object size mismatch: {name}")
+        elif rehash is True or (rehash and name in rehash):
+            to_hash[entry["sha256"]] = name
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for digest, actual in zip(to_hash, pool.map(file_digest, [object_path(dest, d) for d in to_hash])):
+            if actual != digest:
+                problems.append(f"object corrupt: {to_hash[digest]}")
+    return problems
+
+
+def restore_snapshot(dest: str, target: str, snapshot_id: Optional[str] = None, jobs: int = BACKUP_JOBS) -> dict:
+    """Restore a snapshot into `target`: the DB dump plus photos/<filename>.
+
+    Each file is checked against its recorded hash while it is copied.
+    Returns the snapshot's manifest.
+    """
+    manifest = load_manifest(dest, snapshot_id)
+    if manifest is None:
+        raise BackupError(f"No snapshots in {dest}")
+    photos_dir = os.path.join(target, "photos")
+    os.makedirs(photos_dir, exist_ok=True)
+
+    database = manifest["database"]
+    shutil.copyfile(os.path.join(dest, "snapshots", manifest["id"], database["file"]),
+                    os.path.join(target, database["file"]))
+
+    def restore_file(item):
+        name, entry = item
+        if os.path.basename(name) != name:
+            raise BackupError(f"Invalid filename in manifest: {name}")
+        out_path = os.path.join(photos_dir, name)
+        digest = hashlib.sha256()
+        with open(object_path(dest, entry["sha256"]), "rb") as f, open(out_path, "wb") as out:
+            while chunk := f.read(CHUNK_SIZE):
+                digest.update(chunk)
+                out.write(chunk)
+        if digest.hexdigest() != entry["sha256"]:
+            raise BackupError(f"Object corrupt: {name}")
+        os.utime(out_path, ns=(entry["mtime"], entry["mtime"]))
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        list(pool.map(restore_file, manifest["files"].items()))
+    return manifest
+
+
+def prune_snapshots(dest: str, keep: int) -> dict:
+    """Delete all but the newest `keep` snapshots and the objects only they used.
+
+    Leftover snapshot directories without a manifest that are older than
+    the newest kept snapshot are removed too. Unreferenced objects written
+    after that snapshot started are kept, as they may belong to a run in
+    progress. Returns {"snapshots": [removed ids], "objects": n, "bytes": n}.
+    """
+    if keep < 1:
+        raise BackupError("keep must be at least 1")
+    snapshots = list_snapshots(dest)
+    if not snapshots:
+        return {"snapshots": [], "objects": 0, "bytes": 0}
+    kept, removed = snapshots[-keep:], snapshots[:-keep]
+    root = os.path.join(dest, "snapshots")
+    for snapshot_id in sorted(os.listdir(root)):
+        if snapshot_id in removed or (snapshot_id not in kept and snapshot_id < kept[-1]):
+            shutil.rmtree(os.path.join(root, snapshot_id))
+
+    referenced = set()
+    for snapshot_id in kept:
+        referenced.update(entry["sha256"] for entry in load_manifest(dest, snapshot_id)["files"].values())
+    cutoff = datetime.fromisoformat(load_manifest(dest, kept[-1])["created_at"]).timestamp()
+    objects, freed = 0, 0
+    objects_dir = os.path.join(dest, "objects")
+    for prefix in os.listdir(objects_dir) if os.path.isdir(objects_dir) else []:
+        if prefix == "tmp":
+            continue
+        for entry in os.scandir(os.path.join(objects_dir, prefix)):
+            if entry.name in referenced:
+                continue
+            st = entry.stat()
+            if st.st_mtime >= cutoff:
+                continue
+            os.remove(entry.path)
+            objects += 1
+            freed += st.st_size
+    return {"snapshots": removed, "objects": objects, "bytes": freed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dest", default=BACKUP_DIR, help="backup repository directory")
+    parser.add_argument("--jobs", type=int, default=BACKUP_JOBS)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    snapshot = commands.add_parser("snapshot", help="back up the DB and new/changed photos")
+    snapshot.add_argument("--no-verify", action="store_true", help="skip re-hashing newly copied objects")
+
+    verify = commands.add_parser("verify", help="check a snapshot's objects")
+    verify.add_argument("--snapshot", help="snapshot id (default: latest)")
+    verify.add_argument("--full", action="store_true", help="re-hash every object, not just check sizes")
+
+    restore = commands.add_parser("restore", help="restore a snapshot into a local directory")
+    restore.add_argument("--snapshot", help="snapshot id (default: latest)")
+    restore.add_argument("--target", required=True)
+
+    prune = commands.add_parser("prune", help="delete old snapshots and objects no longer referenced")
+    prune.add_argument("--keep", type=int, required=True, help="number of newest snapshots to keep")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    if args.command == "snapshot":
+        from main import DATABASE_URL, PHOTOS_DIR
+        manifest = create_snapshot(DATABASE_URL, PHOTOS_DIR, args.dest, args.jobs, verify=not args.no_verify)
+        stats = manifest["stats"]
+        print(f"Snapshot {manifest['id']}: {stats['files']} files, {stats['copied']} copied "
+              f"({stats['bytes_copied'] / 1024 ** 2:.1f} MB), {stats['reused']} unchanged, "
+              f"{len(stats['missing'])} missing")
+    elif args.command == "verify":
+        manifest = load_manifest(args.dest, args.snapshot)
+        if manifest is None:
+            raise SystemExit(f"No snapshots in {args.dest}")
+        problems = verify_snapshot(args.dest, manifest, rehash=args.full, jobs=args.jobs)
+        for problem in problems:
+            print(problem)
+        print(f"Snapshot {manifest['id']}: {'OK' if not problems else f'{len(problems)} problems'}")
+        raise SystemExit(1 if problems else 0)
+    elif args.command == "prune":
+        result = prune_snapshots(args.dest, args.keep)
+        print(f"Removed {len(result['snapshots'])} snapshots and {result['objects']} objects "
+              f"({result['bytes'] / 1024 ** 2:.1f} MB)")
+    else:
+        manifest = restore_snapshot(args.dest, args.target, args.snapshot, args.jobs)
+        print(f"Restored snapshot {manifest['id']} ({len(manifest['files'])} files) into {args.target}")
+        if manifest["database"]["format"] == "pg_dump":
+            dump = os.path.join(args.target, manifest["database"]["file"])
+            print(f"Load the database with: pg_restore --clean --if-exists --no-owner -d <DATABASE_URL> {dump}")
+
+
+if __name__ == "__main__":
+    main()
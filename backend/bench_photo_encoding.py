@@ -0,0 +1,86 @@
+"""Benchmark photo list encodings: Pydantic PhotoResponse JSON vs columnar JSON/MessagePack.
+
+Usage: python bench_photo_encoding.py [--photos 5000] [--repeat 20]
+"""
+
+import argparse
+import gzip
+import json
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import encoding
+from schemas import PhotoResponse
+
+COLUMN_NAMES = [column.key for column in encoding.PHOTO_COLUMNS]
+
+
+def make_photos(n: int) -> list:
+    start = datetime(2019, 6, 1, 12, 0, 0)
+    # Every selected column defaults to None, so new columns can't break the benchmark
+    return [
+        SimpleNamespace(**{
+            **dict.fromkeys(COLUMN_NAMES),
+            "id": i,
+            "filename": f"{i:032x}.jpg",
+            "original_name": f"IMG_{i:05d}.jpg",
+            "file_size": 2_000_000 + i,
+            "mime_type": "image/jpeg",
+            "media_type": "image",
+            "uploaded_at": start + timedelta(minutes=i),
+        })
+        for i in range(n)
+    ]
+
+
+def pydantic_json(photos) -> bytes:
+    # Mirrors FastAPI's response_model path: validate, jsonable_encoder, json.dumps
+    validated = TypeAdapter(List[PhotoResponse]).validate_python(photos, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated), ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def columnar(media_type):
+    def run(photos) -> bytes:
+        rows = [tuple(getattr(p, name) for name in COLUMN_NAMES) for p in photos]
+        return encoding.encode(encoding.to_columns(rows, COLUMN_NAMES), media_type)
+    return run
+
+
+def measure(fn, photos, repeat: int):
+    payload = fn(photos)
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(photos)
+        best = min(best, time.perf_counter() - t0)
+    return payload, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--photos", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    photos = make_photos(args.photos)
+    candidates = [
+        ("pydantic PhotoResponse JSON", pydantic_json),
+        (encoding.COLUMNAR_JSON, columnar(encoding.COLUMNAR_JSON)),
+    ]
+    if encoding._msgpack() is not None:
+        candidates.append((encoding.MSGPACK, columnar(encoding.MSGPACK)))
+
+    print(f"{args.photos} photos, best of {args.repeat}")
+    print(f"{'format':<38} {'bytes':>10} {'gzip':>9} {'encode ms':>10}")
+    for name, fn in candidates:
+        payload, seconds = measure(fn, photos, args.repeat)
+        print(f"{name:<38} {len(payload):>10} {len(gzip.compress(payload)):>9} {seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
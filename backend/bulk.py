@@ -0,0 +1,219 @@
+"""Bulk album membership operations applied as set-based SQL in chunked transactions.
+
+Operations arrive as NDJSON, one per line:
+
+    {"op": "copy", "photo_ids": [1, 2], "to": 5}
+    {"op": "move", "photo_ids": [1, 2], "from": 5, "to": 6}
+    {"op": "remove", "photo_ids": [1, 2], "from": 6}
+    {"op": "set_cover", "album_id": 6, "photo_id": 1}
+
+The export endpoint writes the same format, so an export can be replayed.
+"""
+
+import json
+from typing import AsyncIterator, Iterator, List, Tuple, Union
+
+from pydantic import ValidationError
+from sqlalchemy import and_, delete, exists, func, insert, literal, select, update
+from sqlalchemy.orm import Session
+
+from models import Album, Photo, photo_albums
+from schemas import AlbumBulkOperation
+
+# Operations committed per transaction
+BULK_CHUNK_SIZE = 200
+# Photo ids per statement, to keep IN lists and bind parameters bounded
+BULK_ID_BATCH = 1000
+MAX_REPORTED_ERRORS = 100
+MAX_LINE_BYTES = 1024 * 1024
+
+
+async def iter_lines(stream: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, bytes]]:
+    """Split a streamed body into numbered lines without buffering it whole."""
+    buffer, number = b"", 0
+    async for chunk in stream:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            number += 1
+            yield number, line
+        if len(buffer) > MAX_LINE_BYTES:
+            raise ValueError(f"Line {number + 1} exceeds {MAX_LINE_BYTES} bytes")
+    if buffer:
+        yield number + 1, buffer
+
+
+def parse_line(line: bytes) -> Union[AlbumBulkOperation, str]:
+    """Parse one NDJSON line into an operation, or return an error message."""
+    try:
+        return AlbumBulkOperation.model_validate_json(line)
+    except ValidationError as e:
+        return f"Invalid operation: {e.errors()[0]['msg']}"
+
+
+def _batches(ids: List[int]) -> Iterator[List[int]]:
+    unique = list(dict.fromkeys(ids))
+    for i in range(0, len(unique), BULK_ID_BATCH):
+        yield unique[i:i + BULK_ID_BATCH]
+
+
+def _copy(db: Session, photo_ids: List[int], album_id: int) -> Tuple[int, List[int]]:
+    """Add existing photos to an album; returns (rows added, ids not found)."""
+    added, missing = 0, []
+    for batch in _batches(photo_ids):
+        found = {
+            photo_id for (photo_id,) in db.execute(
+                select(Photo.id).where(Photo.id.in_(batch), Photo.deleted_at.is_(None))
+            )
+        }
+        missing += [photo_id for photo_id in batch if photo_id not in found]
+        already = exists().where(and_(
+            photo_albums.c.photo_id == Photo.id,
+            photo_albums.c.album_id == album_id,
+        ))
+        rows = select(Photo.id, literal(album_id)).where(
+            Photo.id.in_(batch), Photo.deleted_at.is_(None), ~already
+        )
+        added += db.execute(insert(photo_albums).from_select(["photo_id", "album_id"], rows)).rowcount
+    return added, missing
+
+
+def _members(db: Session, batch: List[int], album_id: int) -> set:
+    return {
+        photo_id for (photo_id,) in db.execute(
+            select(photo_albums.c.photo_id).where(
+                photo_albums.c.album_id == album_id,
+                photo_albums.c.photo_id.in_(batch),
+            )
+        )
+    }
+
+
+def _move(db: Session, photo_ids: List[int], from_album: int, to_album: int) -> Tuple[int, int, List[int]]:
+    """Move photos that are in `from_album`; returns (added, removed, ids not in it)."""
+    added, removed, missing = 0, 0, []
+    target = photo_albums.alias("target")
+    for batch in _batches(photo_ids):
+        members = _members(db, batch, from_album)
+        missing += [photo_id for photo_id in batch if photo_id not in members]
+        if from_album == to_album or not members:
+            continue
+        already = exists().where(and_(
+            target.c.photo_id == photo_albums.c.photo_id,
+            target.c.album_id == to_album,
+        ))
+        rows = select(photo_albums.c.photo_id, literal(to_album)).where(
+            photo_albums.c.album_id == from_album,
+            photo_albums.c.photo_id.in_(members),
+            ~already,
+        )
+        added += db.execute(insert(photo_albums).from_select(["photo_id", "album_id"], rows)).rowcount
+        removed += db.execute(delete(photo_albums).where(
+            photo_albums.c.album_id == from_album,
+            photo_albums.c.photo_id.in_(members),
+        )).rowcount
+    return added, removed, missing
+
+
+def _remove(db: Session, photo_ids: List[int], album_id: int) -> Tuple[int, List[int]]:
+    """Remove photos from an album; returns (rows removed, ids not in it)."""
+    removed, missing = 0, []
+    for batch in _batches(photo_ids):
+        members = _members(db, batch, album_id)
+        missing += [photo_id for photo_id in batch if photo_id not in members]
+        if members:
+            removed += db.execute(delete(photo_albums).where(
+                photo_albums.c.album_id == album_id,
+                photo_albums.c.photo_id.in_(members),
+            )).rowcount
+    return removed, missing
+
+
+def apply_chunk(db: Session, chunk: List[Tuple[int, AlbumBulkOperation]], result: dict):
+    """Apply one chunk of operations in a single transaction, updating `result` counts.
+
+    Photos that cannot be copied (unknown or deleted) or are not in the
+    `from` album are skipped; the rest of the line is applied and the line
+    is also reported in `errors` with those `photo_ids`.
+    """
+    album_ids = set()
+    for _, op in chunk:
+        album_ids.update(a for a in (op.from_album, op.to_album, op.album_id) if a is not None)
+    known = {a for (a,) in db.query(Album.id).filter(Album.id.in_(album_ids))} if album_ids else set()
+
+    touched, counts, errors = set(), {"added": 0, "removed": 0, "covers_set": 0}, []
+    applied = 0
+    for number, op in chunk:
+        missing = [a for a in (op.from_album, op.to_album, op.album_id) if a is not None and a not in known]
+        if missing:
+            errors.append({"line": number, "detail": f"Album not found: {missing[0]}"})
+            continue
+        skipped, detail = [], None
+        if op.op == "copy":
+            added, skipped = _copy(db, op.photo_ids, op.to_album)
+            counts["added"] += added
+            touched.add(op.to_album)
+            detail = "Photos not found"
+        elif op.op == "move":
+            added, removed, skipped = _move(db, op.photo_ids, op.from_album, op.to_album)
+            counts["added"] += added
+            counts["removed"] += removed
+            touched.update((op.from_album, op.to_album))
+            detail = f"Photos not in album {op.from_album}"
+        elif op.op == "remove":
+            removed, skipped = _remove(db, op.photo_ids, op.from_album)
+            counts["removed"] += removed
+            touched.add(op.from_album)
+            detail = f"Photos not in album {op.from_album}"
+        else:
+            photo_ok = db.query(Photo.id).filter(Photo.id == op.photo_id, Photo.deleted_at.is_(None)).first()
+            if not photo_ok:
+                errors.append({"line": number, "detail": f"Photo not found: {op.photo_id}"})
+                continue
+            db.execute(update(Album).where(Album.id == op.album_id).values(cover_photo_id=op.photo_id))
+            counts["covers_set"] += 1
+            touched.add(op.album_id)
+        if skipped:
+            errors.append({"line": number, "detail": detail, "photo_ids": skipped})
+        applied += 1
+
+    if touched:
+        db.execute(update(Album).where(Album.id.in_(touched)).values(updated_at=func.now()))
+    db.commit()
+
+    result["applied"] += applied
+    for key, value in counts.items():
+        result[key] += value
+    record_errors(result, errors)
+
+
+def record_errors(result: dict, errors: List[dict]):
+    result["failed"] += len(errors)
+    room = MAX_REPORTED_ERRORS - len(result["errors"])
+    result["errors"].extend(errors[:max(room, 0)])
+
+
+def export_lines(db: Session, batch_size: int = BULK_ID_BATCH) -> Iterator[bytes]:
+    """Current memberships and covers as replayable NDJSON operations."""
+    current, photo_ids = None, []
+    rows = (
+        db.query(photo_albums.c.album_id, photo_albums.c.photo_id)
+        .order_by(photo_albums.c.album_id, photo_albums.c.photo_id)
+        .yield_per(5000)
+    )
+    for album_id, photo_id in rows:
+        if photo_ids and (album_id != current or len(photo_ids) >= batch_size):
+            yield _line({"op": "copy", "to": current, "photo_ids": photo_ids})
+            photo_ids = []
+        current = album_id
+        photo_ids.append(photo_id)
+    if photo_ids:
+        yield _line({"op": "copy", "to": current, "photo_ids": photo_ids})
+
+    covers = db.query(Album.id, Album.cover_photo_id).filter(Album.cover_photo_id.isnot(None)).order_by(Album.id)
+    for album_id, photo_id in covers.yield_per(5000):
+        yield _line({"op": "set_cover", "album_id": album_id, "photo_id": photo_id})
+
+
+def _line(data: dict) -> bytes:
+    return json.dumps(data, separators=(",", ":")).encode() + b"\n"
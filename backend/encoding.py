@@ -0,0 +1,111 @@
+"""Compact encodings for photo lists: columnar JSON (orjson) and MessagePack.
+
+The default `application/json` response stays the Pydantic PhotoResponse
+list. Clients that send one of the compact media types in Accept get the
+same fields as parallel columns, with datetimes as epoch seconds.
+"""
+
+import json
+from datetime import datetime, timezone
+from typing import Iterable, Optional, Sequence
+
+from starlette.responses import Response
+
+from models import Photo
+
+JSON = "application/json"
+COLUMNAR_JSON = "application/vnd.home.columnar+json"
+MSGPACK = "application/x-msgpack"
+MSGPACK_ALIASES = {"application/x-msgpack", "application/msgpack", "application/vnd.msgpack"}
+
+PHOTO_COLUMNS = (
+    Photo.id, Photo.filename, Photo.original_name, Photo.file_size, Photo.mime_type,
+    Photo.media_type, Photo.duration, Photo.playback_filename, Photo.poster_filename,
+    Photo.processing_status, Photo.latitude, Photo.longitude, Photo.description, Photo.uploaded_at,
+    Photo.taken_at,
+)
+
+
+def _msgpack():
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def _dumps_json(data) -> bytes:
+    try:
+        import orjson
+    except ImportError:
+        return json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode()
+    return orjson.dumps(data)
+
+
+def negotiate(accept: Optional[str]) -> str:
+    """Return the response media type for an Accept header (JSON by default).
+
+    The supported type with the highest q value wins; ties go to the one
+    listed first and q=0 rules a type out.
+    """
+    best, best_q = JSON, 0.0
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        media_type = media_type.lower()
+        if media_type == COLUMNAR_JSON:
+            candidate = COLUMNAR_JSON
+        elif media_type in MSGPACK_ALIASES and _msgpack() is not None:
+            candidate = MSGPACK
+        elif media_type in (JSON, "application/*", "*/*"):
+            candidate = JSON
+        else:
+            continue
+        if q > best_q:
+            best, best_q = candidate, q
+    return best
+
+
+def epoch(value: Optional[datetime]) -> Optional[int]:
+    """Seconds since the epoch; naive datetimes from the DB are UTC."""
+    if value is None:
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp())
+
+
+def to_columns(rows: Iterable[Sequence], names: Sequence[str]) -> dict:
+    """Transpose result rows into {"count": n, "columns": {name: [values]}}."""
+    columns = {name: [] for name in names}
+    appenders = [columns[name].append for name in names]
+    count = 0
+    for row in rows:
+        count += 1
+        for append, value in zip(appenders, row):
+            append(epoch(value) if isinstance(value, datetime) else value)
+    return {"count": count, "columns": columns}
+
+
+def encode(data: dict, media_type: str) -> bytes:
+    if media_type == MSGPACK:
+        return _msgpack().packb(data, use_bin_type=True)
+    return _dumps_json(data)
+
+
+def select_photo_columns(query):
+    """Narrow a Photo query to plain PHOTO_COLUMNS tuples (no ORM objects)."""
+    return query.with_entities(*PHOTO_COLUMNS)
+
+
+def photo_columns_response(rows: Sequence[Sequence], media_type: str, headers: Optional[dict] = None) -> Response:
+    """Encode PHOTO_COLUMNS rows compactly."""
+    data = to_columns(rows, [column.key for column in PHOTO_COLUMNS])
+    return Response(encode(data, media_type), media_type=media_type, headers={"Vary": "Accept", **(headers or {})})
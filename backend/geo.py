@@ -0,0 +1,172 @@
+"""Geohash encoding, bounding-box cover cells and EXIF GPS extraction.
+
+Photos store latitude/longitude plus a geohash column with a plain B-tree
+index, which works on both PostgreSQL and SQLite. A bounding box is
+turned into a handful of geohash prefixes (range scans on that index),
+and markers are clustered by grouping on a shorter geohash prefix
+chosen from the map zoom level.
+
+Photos uploaded before locations were stored get theirs with
+``python geo.py backfill`` (see `backfill`).
+"""
+
+import argparse
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from models import Photo
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12
+# Upper bound on index range scans for one bounding box query
+MAX_COVER_CELLS = 32
+# Target on-screen width of one cluster cell in a 256px-tile web map
+CLUSTER_CELL_PX = 64
+
+
+def encode(lat: float, lon: float, precision: int = GEOHASH_PRECISION) -> str:
+    lat_range, lon_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, bit_count, even = [], 0, 0, True
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(BASE32[bits])
+            bits, bit_count = 0, 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> Tuple[float, float]:
+    """(lat_degrees, lon_degrees) spanned by one cell of `precision` chars."""
+    lon_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lon_bits)
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Coarsest geohash precision whose cells are at most CLUSTER_CELL_PX wide at `zoom`."""
+    world_px = 256 * (1 << zoom)
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        if cell_size(precision)[1] / 360.0 * world_px <= CLUSTER_CELL_PX:
+            return precision
+    return GEOHASH_PRECISION
+
+
+def cover(bbox: Tuple[float, float, float, float], max_cells: int = MAX_COVER_CELLS) -> List[str]:
+    """Geohash prefixes whose cells together cover bbox (min_lon, min_lat, max_lon, max_lat).
+
+    Uses the finest precision that needs at most `max_cells` cells; an
+    empty list means the box is too large to narrow down (scan all).
+    """
+    min_lon, min_lat, max_lon, max_lat = bbox
+    best: List[str] = []
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        lat_step, lon_step = cell_size(precision)
+        rows = int(max_lat // lat_step) - int(min_lat // lat_step) + 1
+        cols = int(max_lon // lon_step) - int(min_lon // lon_step) + 1
+        if rows * cols > max_cells:
+            break
+        # Stepping one cell at a time from the min corner visits every row/column
+        best = sorted({
+            encode(min(min_lat + i * lat_step, max_lat), min(min_lon + j * lon_step, max_lon), precision)
+            for i in range(rows)
+            for j in range(cols)
+        })
+    return best
+
+
+def prefix_upper_bound(prefix: str) -> str:
+    """Smallest string greater than every geohash starting with `prefix`."""
+    return prefix + "~"  # "~" sorts after every base32 character
+
+
+def _rational(value) -> float:
+    try:
+        return float(value)
+    except TypeError:
+        numerator, denominator = value
+        return numerator / denominator
+
+
+def exif_coordinates(path: str) -> Optional[Tuple[float, float]]:
+    """(lat, lon) from a photo's EXIF GPS tags, or None."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as img:
+            gps = img.getexif().get_ifd(0x8825)  # GPSInfo
+    except Exception:
+        return None
+    if not gps or 2 not in gps or 4 not in gps:
+        return None
+    try:
+        lat = sum(_rational(v) / 60 ** i for i, v in enumerate(gps[2]))
+        lon = sum(_rational(v) / 60 ** i for i, v in enumerate(gps[4]))
+    except (TypeError, ValueError, ZeroDivisionError):
+        return None
+    if gps.get(1) == "S":
+        lat = -lat
+    if gps.get(3) == "W":
+        lon = -lon
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def backfill(db: Session, batch_size: int = 500) -> int:
+    """Read EXIF GPS for image rows without a geohash; returns photos located.
+
+    Rows are walked in id order and committed per batch, so the command
+    can be interrupted and re-run.
+    """
+    located, last_id = 0, 0
+    while True:
+        photos = (
+            db.query(Photo)
+            .filter(
+                Photo.id > last_id,
+                Photo.geohash.is_(None),
+                Photo.media_type == "image",
+                Photo.deleted_at.is_(None),
+            )
+            .order_by(Photo.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not photos:
+            return located
+        for photo in photos:
+            coordinates = exif_coordinates(photo.file_path)
+            if coordinates:
+                photo.latitude, photo.longitude = coordinates
+                photo.geohash = encode(*coordinates)
+                located += 1
+        last_id = photos[-1].id
+        db.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Photo location maintenance")
+    parser.add_argument("command", choices=["backfill"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from main import db_session
+    with db_session() as db:
+        located = backfill(db, args.batch_size)
+    print(f"Read locations for {located} photos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+"""Responsive image variants: format/size negotiation, encoding and a bounded disk cache."""
+
+import io
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+# Requested widths are rounded up to one of these so the cache stays small;
+# the largest is also the width of variants requested without a size
+WIDTH_BUCKETS = [160, 320, 480, 640, 960, 1280, 1600, 1920, 2560, 3840]
+MAX_DPR = 4.0
+
+# Decoding and AVIF encoding take hundreds of MB for large photos; only run
+# this many at once and serve the original when no slot frees up in time
+ENCODE_SLOTS = threading.BoundedSemaphore(int(os.getenv("IMAGE_ENCODE_CONCURRENCY", "1")))
+ENCODE_WAIT_SECONDS = float(os.getenv("IMAGE_ENCODE_WAIT_SECONDS", "10"))
+
+# Output formats in order of preference, with the MIME type they are served as
+FORMAT_MIME = {
+    "avif": "image/avif",
+    "webp": "image/webp",
+    "jpeg": "image/jpeg",
+    "png": "image/png",
+}
+ENCODE_OPTIONS = {
+    "avif": {"quality": 55, "speed": 7},
+    "webp": {"quality": 80, "method": 4},
+    "jpeg": {"quality": 82, "progressive": True, "optimize": True},
+    "png": {"optimize": True},
+}
+
+
+class EncoderBusy(Exception):
+    """No encode slot became free within ENCODE_WAIT_SECONDS."""
+
+
+def _pil():
+    """Import Pillow on first use; returns None when it is not installed."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:
+        return None
+    return Image, ImageOps
+
+
+def encoder_available(fmt: str) -> bool:
+    pil = _pil()
+    if pil is None:
+        return False
+    if fmt in ("jpeg", "png"):
+        return True
+    from PIL import features
+    return bool(features.check(fmt))
+
+
+def _accepted_types(accept: str) -> dict:
+    types = {}
+    for part in (accept or "").split(","):
+        media_type, *params = [p.strip() for p in part.split(";")]
+        q = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip() == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if media_type:
+            types[media_type.lower()] = q
+    return types
+
+
+def negotiate_format(accept: Optional[str], original_mime: Optional[str]) -> str:
+    """Pick the output format from the Accept header.
+
+    Modern formats are only chosen when the client lists them explicitly
+    (browsers that support AVIF/WebP always do); otherwise the original
+    format is kept, falling back to JPEG.
+    """
+    types = _accepted_types(accept)
+    for fmt in ("avif", "webp"):
+        if types.get(FORMAT_MIME[fmt], 0) > 0 and encoder_available(fmt):
+            return fmt
+    return "png" if original_mime == "image/png" else "jpeg"
+
+
+def requested_width(
+    w: Optional[int] = None,
+    dpr: Optional[float] = None,
+    ch_width: Optional[str] = None,
+    ch_dpr: Optional[str] = None,
+) -> Optional[int]:
+    """Resolve the target width in device pixels.
+
+    An explicit `w` (CSS pixels, multiplied by `dpr`/DPR hint) wins over
+    the `Sec-CH-Width` client hint, which is already in device pixels.
+    """
+    def _float(value) -> Optional[float]:
+        try:
+            return float(value) if value not in (None, "") else None
+        except ValueError:
+            return None
+
+    ratio = min(max(_float(dpr) or _float(ch_dpr) or 1.0, 1.0), MAX_DPR)
+    if w:
+        return int(w * ratio)
+    hinted = _float(ch_width)
+    return int(hinted) if hinted else None
+
+
+def bucket_width(width: Optional[int]) -> Optional[int]:
+    """Round up to a width bucket; None means "original size"."""
+    if not width:
+        return None
+    return next((b for b in WIDTH_BUCKETS if b >= width), WIDTH_BUCKETS[-1])
+
+
+def encode_variant(src_path: str, width: Optional[int], fmt: str) -> bytes:
+    """Decode, orient, downscale (never upscale) and re-encode an image.
+
+    Raises EncoderBusy when all ENCODE_SLOTS stay taken for ENCODE_WAIT_SECONDS.
+    """
+    if not ENCODE_SLOTS.acquire(timeout=ENCODE_WAIT_SECONDS):
+        raise EncoderBusy(f"No image encode slot free after {ENCODE_WAIT_SECONDS:g}s")
+    try:
+        return _encode(src_path, width, fmt)
+    finally:
+        ENCODE_SLOTS.release()
+
+
+def _encode(src_path: str, width: Optional[int], fmt: str) -> bytes:
+    Image, ImageOps = _pil()
+    with Image.open(src_path) as img:
+        if width and img.format == "JPEG":
+            # Let libjpeg decode at a reduced scale instead of full resolution.
+            # Orientations 5-8 are rotated 90 degrees, so the stored height
+            # becomes the displayed width.
+            if img.getexif().get(0x0112) in (5, 6, 7, 8):
+                img.draft("RGB", (max(1, img.width * width // img.height), width))
+            else:
+                img.draft("RGB", (width, max(1, img.height * width // img.width)))
+        img = ImageOps.exif_transpose(img)
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS, reducing_gap=3.0)
+        if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+            img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "transparency" in img.info else "RGB")
+        out = io.BytesIO()
+        img.save(out, format=fmt.upper(), **ENCODE_OPTIONS[fmt])
+        return out.getvalue()
+
+
+class VariantCache:
+    """On-disk cache of encoded variants, evicted LRU by total bytes.
+
+    Concurrent requests for a variant that is not cached yet share a
+    single encode. The directory is shared by all uvicorn workers (and
+    pruned by the sweeper), so recency is kept in file mtimes and the
+    directory is rescanned before evicting, at most every
+    `rescan_seconds`; between rescans the limit can be exceeded by what
+    other workers write in that window.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, rescan_seconds: float = 10.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.rescan_seconds = rescan_seconds
+        self.total_bytes = 0
+        self._entries = OrderedDict()  # key -> size, least recently used first
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._scanned_at = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild the index from the directory, oldest mtime first.
+
+        mtimes can tie (coarse filesystem clocks); ties keep this process's
+        own LRU order.
+        """
+        order = {key: i for i, key in enumerate(self._entries)}
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith("tmp_"):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime, order.get(entry.name, -1), entry.name, st.st_size))
+        self._entries.clear()
+        self.total_bytes = 0
+        for _, _, name, size in sorted(files):
+            self._entries[name] = size
+            self.total_bytes += size
+        self._scanned_at = time.monotonic()
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            path = self.path(key)
+            try:
+                os.utime(path)  # recency shared with the other workers
+            except FileNotFoundError:
+                # Not cached, or evicted by another worker or the sweeper
+                self.total_bytes -= self._entries.pop(key, 0)
+                return None
+            if key not in self._entries:
+                # Written by another worker since the last scan
+                size = os.path.getsize(path)
+                self._entries[key] = size
+                self.total_bytes += size
+            self._entries.move_to_end(key)
+        return path
+
+    def put(self, key: str, data: bytes) -> str:
+        path = self.path(key)
+        tmp = self.path(f"tmp_{uuid.uuid4().hex}")
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self.total_bytes += len(data) - self._entries.pop(key, 0)
+            self._entries[key] = len(data)
+            self._evict()
+        return path
+
+    def _evict(self):
+        if self.total_bytes > self.max_bytes or time.monotonic() - self._scanned_at >= self.rescan_seconds:
+            self._load()
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            try:
+                os.remove(self.path(key))
+            except FileNotFoundError:
+                pass
+
+    def get_or_create(self, key: str, produce: Callable[[], bytes]) -> str:
+        """Return the cached path for `key`, encoding it once if missing."""
+        path = self.get(key)
+        if path:
+            return path
+        with self._lock:
+            if key in self._entries:
+                return self.path(key)  # finished while we were checking
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            path = self.put(key, produce())
+            future.set_result(path)
+            return path
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_variant_cache(directory: str, max_bytes: int) -> VariantCache:
+    """Create the process-wide cache on first use."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = VariantCache(directory, max_bytes)
+        return _cache
@@ -1,37 +1,104 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException, Depends
+from fastapi import FastAPI, UploadFile, File, HTTPException, Depends, BackgroundTasks, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from sqlalchemy import create_engine, text
+from fastapi.responses import FileResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import create_engine, text, func, and_, or_
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List
-import os, uuid, shutil
-from models import Base, Photo, Event, Album
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
+from typing import List, Optional
+from urllib.parse import quote
+import os, uuid, shutil, logging, asyncio
+import archive, bulk, encoding, geo, imaging, media, ratelimit, sweeper, timeline
+from models import Base, Photo, Event, Album, photo_albums
 from schemas import (
-    PhotoResponse, EventCreate, EventResponse, EventUpdate,
-    AlbumCreate, AlbumResponse, AlbumUpdate, AlbumWithPhotos, 
-    PhotoAlbumAssociation
+    PhotoResponse, PhotoUpdate, GeoCluster, EventCreate, EventResponse, EventUpdate,
+    AlbumCreate, AlbumResponse, AlbumUpdate, AlbumWithPhotos, AlbumBulkResult,
+    PhotoAlbumAssociation, PhotoBulkDelete, TimelineResponse
 )
 
 # Database configuration
 DATABASE_URL = os.getenv("DATABASE_URL", "postgresql://home:homepw@db:5432/homepg")
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+
+
+@lru_cache(maxsize=None)
+def get_engine():
+    """Create the engine (and load the DB driver) on first use, not at import."""
+    connect_args = {"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {}
+    return create_engine(DATABASE_URL, connect_args=connect_args)
 
 def get_db():
-    db = SessionLocal()
+    db = SessionLocal(bind=get_engine())
     try:
         yield db
     finally:
         db.close()
 
+logger = logging.getLogger(__name__)
+
+# Background garbage collection of deleted photos, orphaned files and stale tmp_* uploads
+GC_INTERVAL_SECONDS = int(os.getenv("GC_INTERVAL_SECONDS","600"))
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE","500"))
+GC_ORPHAN_MIN_AGE_SECONDS = int(os.getenv("GC_ORPHAN_MIN_AGE_SECONDS","3600"))
+
+
+def run_sweep(include_orphans: bool = True):
+    """One bounded garbage-collection pass; runs in a worker thread."""
+    try:
+        with db_session() as db:
+            sweeper.purge_deleted(db, PHOTOS_DIR, VARIANT_CACHE_DIR, GC_BATCH_SIZE)
+            if include_orphans:
+                sweeper.sweep_orphans(db, PHOTOS_DIR, GC_BATCH_SIZE, GC_ORPHAN_MIN_AGE_SECONDS)
+    except Exception:
+        logger.exception("Photo garbage collection failed")
+
+
+# Set STARTUP_WARMUP=true to connect to the DB and load image codecs during startup
+# instead of on the first request that needs them
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP","false").lower() == "true"
+
+
+def warm_up():
+    with db_session() as db:
+        db.execute(text("SELECT 1"))
+    imaging.encoder_available("avif")
+
+
+async def sweep_periodically():
+    while True:
+        await asyncio.sleep(GC_INTERVAL_SECONDS)
+        await asyncio.to_thread(run_sweep)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    os.makedirs(PHOTOS_DIR, exist_ok=True)
+    rate_limiter.check_backend()
+    if STARTUP_WARMUP:
+        await asyncio.to_thread(warm_up)
+    task = asyncio.create_task(sweep_periodically()) if GC_INTERVAL_SECONDS > 0 else None
+    start_transcoder()
+    yield
+    if task:
+        task.cancel()
+    stop_transcoder()
+
+
 # FastAPI app configuration
 app = FastAPI(
     title=os.getenv("APP_NAME", "우리집 홈페이지 API"),
     description="가족용 사진/일정 공유 홈페이지 API",
-    version="0.1.0"
+    version="0.1.0",
+    lifespan=lifespan
 )
 
+# Rate limiting for upload/write endpoints (added before CORS so 429s carry CORS headers)
+rate_limiter = ratelimit.RateLimiter.from_env()
+app.add_middleware(ratelimit.RateLimitMiddleware, limiter=rate_limiter)
+
 # CORS configuration
 origins = [o.strip() for o in os.getenv("CORS_ORIGINS", "http://localhost:5173").split(",")]
 app.add_middleware(
@@ -40,16 +107,148 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Retry-After", "X-Next-Cursor"],
 )
 
 # Photo directory setup
 PHOTOS_DIR = os.getenv("PHOTOS_DIR", "/data/photos")
 ALLOWED = set(os.getenv("ALLOWED_EXTS","jpg,jpeg,png,webp").split(","))
 MAX_MB = int(os.getenv("MAX_UPLOAD_MB","10"))
-os.makedirs(PHOTOS_DIR, exist_ok=True)
+VIDEO_ALLOWED = set(os.getenv("ALLOWED_VIDEO_EXTS","mp4,mov").split(","))
+MAX_VIDEO_MB = int(os.getenv("MAX_VIDEO_UPLOAD_MB","1024"))
+# Transcodes are CPU and memory heavy; only run this many at once
+TRANSCODE_CONCURRENCY = int(os.getenv("TRANSCODE_CONCURRENCY","1"))
+VARIANT_CACHE_DIR = os.getenv("VARIANT_CACHE_DIR", os.path.join(PHOTOS_DIR, ".variants"))
+VARIANT_CACHE_MB = int(os.getenv("VARIANT_CACHE_MB","512"))
+
+# Static file serving for photos (with Range support for video seeking).
+# The directory is created in the lifespan, so it is not checked here.
+app.mount("/data/photos", media.RangeStaticFiles(directory=PHOTOS_DIR, check_dir=False), name="photos")
+
+
+@contextmanager
+def db_session():
+    """Open a session outside of a request (background work), honouring dependency overrides."""
+    gen = app.dependency_overrides.get(get_db, get_db)()
+    try:
+        yield next(gen)
+    finally:
+        gen.close()
+
+
+# Dedicated workers for video processing, so queued transcodes never hold
+# threads of the shared pool that serves sync endpoints and get_db
+transcode_pool: Optional[ThreadPoolExecutor] = None
+
+
+def start_transcoder():
+    global transcode_pool
+    transcode_pool = ThreadPoolExecutor(max_workers=TRANSCODE_CONCURRENCY, thread_name_prefix="transcode")
+    # Runs on the pool, so startup never waits for the DB
+    transcode_pool.submit(requeue_videos)
+
 
-# Static file serving for photos
-app.mount("/data/photos", StaticFiles(directory=PHOTOS_DIR), name="photos")
+def stop_transcoder():
+    global transcode_pool
+    if transcode_pool:
+        # Interrupted videos stay pending/processing and are re-queued on the next start
+        transcode_pool.shutdown(wait=False, cancel_futures=True)
+        transcode_pool = None
+
+
+# A claimed video still "processing" after this long belongs to a dead worker.
+# One job runs up to three ffmpeg/ffprobe calls, each bounded by TRANSCODE_TIMEOUT.
+VIDEO_CLAIM_STALE_SECONDS = 3 * media.TRANSCODE_TIMEOUT + 300
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def _claimable():
+    """Videos no live worker is processing: pending, or processing but stale."""
+    stale = _utcnow() - timedelta(seconds=VIDEO_CLAIM_STALE_SECONDS)
+    return and_(
+        Photo.media_type == "video",
+        Photo.deleted_at.is_(None),
+        or_(
+            Photo.processing_status == "pending",
+            and_(
+                Photo.processing_status == "processing",
+                or_(Photo.processing_started_at.is_(None), Photo.processing_started_at < stale),
+            ),
+        ),
+    )
+
+
+def enqueue_video(photo_id: int):
+    if transcode_pool is None:
+        logger.warning("Transcoder not running; video %s stays pending until the next start", photo_id)
+        return
+    transcode_pool.submit(process_video, photo_id)
+
+
+def requeue_videos():
+    """Queue videos left pending, or stuck processing by a dead worker.
+
+    Every uvicorn worker runs this at startup; the claim in process_video
+    makes sure each video is still processed only once.
+    """
+    try:
+        with db_session() as db:
+            ids = [photo_id for (photo_id,) in db.query(Photo.id).filter(_claimable()).order_by(Photo.id)]
+    except Exception:
+        logger.exception("Could not re-queue unfinished videos")
+        return
+    if ids:
+        logger.info("Re-queueing %d unfinished videos", len(ids))
+    for photo_id in ids:
+        enqueue_video(photo_id)
+
+
+def process_video(photo_id: int):
+    """Transcode job: probe duration, build the H.264 rendition and poster frame.
+
+    The row is claimed atomically first; if another worker has it (or it
+    is already done) the job does nothing.
+    """
+    started = _utcnow()
+    with db_session() as db:
+        claimed = (
+            db.query(Photo)
+            .filter(Photo.id == photo_id, _claimable())
+            .update({"processing_status": "processing", "processing_started_at": started}, synchronize_session=False)
+        )
+        db.commit()
+        if not claimed:
+            return
+        photo = db.query(Photo).filter(Photo.id == photo_id).first()
+        src, stem = photo.file_path, photo.filename.rsplit(".", 1)[0]
+
+    playback, poster = f"{stem}_web.mp4", f"{stem}_poster.jpg"
+    try:
+        probe = media.probe_video(src)
+        duration = probe["duration"]
+        media.extract_poster(src, os.path.join(PHOTOS_DIR, poster), at=min(1.0, duration / 2) if duration else 0.0)
+        media.transcode_for_web(src, os.path.join(PHOTOS_DIR, playback), probe)
+    except media.MediaError as e:
+        logger.warning("Video processing failed for photo %s: %s", photo_id, e)
+        values = {"processing_status": "failed"}
+    except Exception:
+        logger.exception("Video processing failed for photo %s", photo_id)
+        values = {"processing_status": "failed"}
+    else:
+        values = {
+            "processing_status": "ready",
+            "duration": duration,
+            "playback_filename": playback,
+            "poster_filename": poster,
+        }
+
+    with db_session() as db:
+        # Only while our claim stands, should the job have outlived the stale limit
+        db.query(Photo).filter(Photo.id == photo_id, Photo.processing_started_at == started).update(values)
+        db.commit()
 
 @app.get("/api/health")
 def health_check(db: Session = Depends(get_db)):
@@ -70,26 +269,154 @@ def health_check(db: Session = Depends(get_db)):
         "version": "0.1.0"
     }
 
+@app.get("/api/metrics", response_class=PlainTextResponse)
+def metrics():
+    """Rate limiter metrics in Prometheus text format."""
+    return rate_limiter.metrics.render()
+
+
 # Photos API endpoints
-@app.get("/api/photos", response_model=List[PhotoResponse])
-def list_photos(db: Session = Depends(get_db)):
-    """Get all uploaded photos."""
-    return db.query(Photo).order_by(Photo.uploaded_at.desc()).all()
+PHOTO_LIST_RESPONSES = {
+    200: {"content": {encoding.COLUMNAR_JSON: {}, encoding.MSGPACK: {}},
+          "description": "PhotoResponse list, or columns when a compact type is requested in Accept"}
+}
+
+
+def photo_list_response(request: Request, response: Response, query, limit: Optional[int] = None):
+    """Return ORM rows for the default JSON path, or a compact columnar encoding.
+    
+    With a `limit`, a full page sets X-Next-Cursor to continue after its last photo.
+    """
+    media_type = encoding.negotiate(request.headers.get("accept"))
+    if limit:
+        query = query.limit(limit)
+    if media_type == encoding.JSON:
+        # Same URL, different representations: caches must key on Accept
+        response.headers["Vary"] = "Accept"
+        photos = query.all()
+        if limit and len(photos) == limit:
+            response.headers["X-Next-Cursor"] = timeline.encode_cursor(photos[-1].taken_at, photos[-1].id)
+        return photos
+    
+    rows = encoding.select_photo_columns(query).all()
+    headers = {}
+    if limit and len(rows) == limit:
+        last = rows[-1]
+        headers["X-Next-Cursor"] = timeline.encode_cursor(last.taken_at, last.id)
+    return encoding.photo_columns_response(rows, media_type, headers)
+
+
+@app.get("/api/photos", response_model=List[PhotoResponse], responses=PHOTO_LIST_RESPONSES)
+def list_photos(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Get uploaded photos, newest first.
+    
+    Without `limit` all photos are returned. With it, pass the X-Next-Cursor
+    header (or a timeline bucket cursor) as `cursor` to fetch the next page.
+    """
+    query = db.query(Photo).filter(Photo.deleted_at.is_(None)).order_by(Photo.taken_at.desc(), Photo.id.desc())
+    if cursor:
+        try:
+            query = query.filter(timeline.after_cursor(cursor))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    return photo_list_response(request, response, query, limit)
+
+
+@app.get("/api/photos/timeline", response_model=TimelineResponse)
+def get_photo_timeline(db: Session = Depends(get_db)):
+    """Photo counts per year/month with a cursor that jumps to the start of each bucket."""
+    buckets = timeline.buckets(db)
+    return {"total": sum(b["count"] for b in buckets), "buckets": buckets}
+
+
+@app.get("/api/photos/geo", response_model=List[GeoCluster])
+def get_photo_clusters(
+    bbox: str = Query(..., description="min_lon,min_lat,max_lon,max_lat"),
+    zoom: int = Query(..., ge=0, le=22),
+    db: Session = Depends(get_db)
+):
+    """Geotagged photos inside bbox, clustered server-side for the given map zoom."""
+    try:
+        min_lon, min_lat, max_lon, max_lat = (float(v) for v in bbox.split(","))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="bbox must be min_lon,min_lat,max_lon,max_lat")
+    if not (-180 <= min_lon <= max_lon <= 180 and -90 <= min_lat <= max_lat <= 90):
+        raise HTTPException(status_code=400, detail="Invalid bbox")
+    
+    cell = func.substr(Photo.geohash, 1, geo.precision_for_zoom(zoom))
+    query = db.query(
+        cell.label("cell"),
+        func.count(Photo.id),
+        func.avg(Photo.latitude),
+        func.avg(Photo.longitude),
+        func.min(Photo.id),
+    ).filter(
+        Photo.deleted_at.is_(None),
+        Photo.latitude.between(min_lat, max_lat),
+        Photo.longitude.between(min_lon, max_lon),
+    )
+    # Narrow to a few geohash index range scans before the exact bbox check
+    prefixes = geo.cover((min_lon, min_lat, max_lon, max_lat))
+    if prefixes:
+        query = query.filter(or_(*[
+            and_(Photo.geohash >= prefix, Photo.geohash < geo.prefix_upper_bound(prefix))
+            for prefix in prefixes
+        ]))
+    else:
+        query = query.filter(Photo.geohash.isnot(None))
+    
+    return [
+        {"geohash": cell, "count": count, "latitude": lat, "longitude": lon, "photo_id": photo_id}
+        for cell, count, lat, lon, photo_id in query.group_by(cell).all()
+    ]
+
+
+def set_location(photo: Photo, latitude: Optional[float], longitude: Optional[float]):
+    photo.latitude, photo.longitude = latitude, longitude
+    photo.geohash = geo.encode(latitude, longitude) if latitude is not None and longitude is not None else None
+
+
+@app.put("/api/photos/{photo_id}", response_model=PhotoResponse)
+def update_photo(photo_id: int, photo_data: PhotoUpdate, db: Session = Depends(get_db)):
+    """Update a photo's description or location."""
+    photo = db.query(Photo).filter(Photo.id == photo_id, Photo.deleted_at.is_(None)).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    
+    update_data = photo_data.model_dump(exclude_unset=True)
+    if ("latitude" in update_data) != ("longitude" in update_data):
+        raise HTTPException(status_code=400, detail="latitude and longitude must be set together")
+    if "latitude" in update_data:
+        set_location(photo, update_data.pop("latitude"), update_data.pop("longitude"))
+    for field, value in update_data.items():
+        setattr(photo, field, value)
+    
+    db.commit()
+    db.refresh(photo)
+    return photo
 
 
 @app.post("/api/photos/upload", response_model=PhotoResponse)
 async def upload_photo(file: UploadFile = File(...), db: Session = Depends(get_db)):
-    """Upload a new photo."""
+    """Upload a new photo or video."""
     ext = (file.filename.rsplit(".",1)[-1] or "").lower()
-    if ext not in ALLOWED:
+    if ext not in ALLOWED and ext not in VIDEO_ALLOWED:
         raise HTTPException(status_code=400, detail="Invalid file type")
+    is_video = ext in VIDEO_ALLOWED
+    max_mb = MAX_VIDEO_MB if is_video else MAX_MB
     
     size, tmp_path = 0, os.path.join(PHOTOS_DIR, f"tmp_{uuid.uuid4().hex}")
     try:
         with open(tmp_path, "wb") as out:
             while chunk := await file.read(1024*1024):
                 size += len(chunk)
-                if size > MAX_MB*1024*1024:
+                if size > max_mb*1024*1024:
                     raise HTTPException(status_code=400, detail="File too large")
                 out.write(chunk)
         
@@ -104,12 +431,23 @@ async def upload_photo(file: UploadFile = File(...), db: Session = Depends(get_d
             original_name=file.filename or "unknown",
             file_path=final_path,
             file_size=size,
-            mime_type=file.content_type
+            mime_type=file.content_type,
+            media_type="video" if is_video else "image",
+            processing_status="pending" if is_video else None
         )
+        if not is_video:
+            set_location(photo, *(geo.exif_coordinates(final_path) or (None, None)))
+            # Without EXIF the default (same now() as uploaded_at) applies
+            photo.taken_at = timeline.exif_capture_time(final_path) or photo.taken_at
         db.add(photo)
+        db.flush()
+        db.refresh(photo)
+        timeline.bump(db, photo.taken_at, 1)
         db.commit()
         db.refresh(photo)
         
+        if is_video:
+            enqueue_video(photo.id)
         return photo
         
     except Exception as e:
@@ -119,6 +457,75 @@ async def upload_photo(file: UploadFile = File(...), db: Session = Depends(get_d
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
+@app.get("/api/photos/{photo_id}/image")
+def get_photo_image(
+    photo_id: int,
+    request: Request,
+    w: Optional[int] = Query(None, ge=1, le=8192),
+    dpr: Optional[float] = Query(None, gt=0),
+    db: Session = Depends(get_db)
+):
+    """Serve a photo (or video poster) resized and encoded for the requesting client.
+    
+    Format follows the Accept header (AVIF > WebP > original), size follows
+    `w`/`dpr` or the Sec-CH-Width/Sec-CH-DPR client hints.
+    """
+    photo = db.query(Photo).filter(Photo.id == photo_id, Photo.deleted_at.is_(None)).first()
+    if not photo:
+        raise HTTPException(status_code=404, detail="Photo not found")
+    
+    source, source_mime = photo.file_path, photo.mime_type
+    if photo.media_type == "video":
+        if not photo.poster_filename:
+            raise HTTPException(status_code=404, detail="Poster not available")
+        source, source_mime = os.path.join(PHOTOS_DIR, photo.poster_filename), "image/jpeg"
+    if not os.path.exists(source):
+        raise HTTPException(status_code=404, detail="File not found")
+    
+    headers = {
+        "Vary": "Accept, Sec-CH-Width, Sec-CH-DPR",
+        "Accept-CH": "Sec-CH-Width, Sec-CH-DPR",
+        "Cache-Control": "public, max-age=86400",
+    }
+    fmt = imaging.negotiate_format(request.headers.get("accept"), source_mime)
+    width = imaging.bucket_width(imaging.requested_width(
+        w, dpr, request.headers.get("sec-ch-width"), request.headers.get("sec-ch-dpr")
+    ))
+    if not imaging.encoder_available(fmt) or (width is None and imaging.FORMAT_MIME[fmt] == source_mime):
+        return FileResponse(source, media_type=source_mime, headers=headers)
+    # Never re-encode at full resolution: unsized requests get the largest bucket
+    width = width or imaging.WIDTH_BUCKETS[-1]
+    
+    stem = os.path.splitext(os.path.basename(source))[0]
+    cache = imaging.get_variant_cache(VARIANT_CACHE_DIR, VARIANT_CACHE_MB*1024*1024)
+    try:
+        path = cache.get_or_create(f"{stem}_{width}.{fmt}", lambda: imaging.encode_variant(source, width, fmt))
+    except Exception as e:
+        # Not decodable (or codec failure): fall back to the original bytes
+        logger.warning("Could not encode variant of photo %s: %s", photo_id, e)
+        return FileResponse(source, media_type=source_mime, headers=headers)
+    return FileResponse(path, media_type=imaging.FORMAT_MIME[fmt], headers=headers)
+
+
+@app.delete("/api/photos/{photo_id}")
+def delete_photo(photo_id: int, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete a photo; its files are removed in the background."""
+    if not sweeper.soft_delete_photos(db, [photo_id]):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    
+    background_tasks.add_task(run_sweep, include_orphans=False)
+    return {"ok": True, "message": "Photo deleted successfully"}
+
+
+@app.delete("/api/photos")
+def delete_photos(photo_data: PhotoBulkDelete, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """Delete several photos at once; unknown or already deleted ids are skipped."""
+    deleted_ids = sweeper.soft_delete_photos(db, photo_data.photo_ids)
+    if deleted_ids:
+        background_tasks.add_task(run_sweep, include_orphans=False)
+    return {"ok": True, "message": f"Deleted {len(deleted_ids)} photos", "deleted_ids": deleted_ids}
+
+
 # Events API endpoints
 @app.get("/api/events", response_model=List[EventResponse])
 def list_events(db: Session = Depends(get_db)):
@@ -224,6 +631,47 @@ def create_album(album_data: AlbumCreate, db: Session = Depends(get_db)):
     }
 
 
+@app.post("/api/albums/bulk", response_model=AlbumBulkResult)
+async def bulk_album_operations(request: Request, db: Session = Depends(get_db)):
+    """Apply a streamed NDJSON list of album operations (copy, move, remove, set_cover).
+    
+    Operations are applied in order, BULK_CHUNK_SIZE per transaction; invalid
+    lines are reported in `errors` and skipped, as are photo ids a line could
+    not apply to.
+    """
+    result = {"applied": 0, "failed": 0, "added": 0, "removed": 0, "covers_set": 0, "errors": []}
+    chunk = []
+    try:
+        async for number, line in bulk.iter_lines(request.stream()):
+            if not line.strip():
+                continue
+            op = bulk.parse_line(line)
+            if isinstance(op, str):
+                bulk.record_errors(result, [{"line": number, "detail": op}])
+                continue
+            chunk.append((number, op))
+            if len(chunk) >= bulk.BULK_CHUNK_SIZE:
+                await asyncio.to_thread(bulk.apply_chunk, db, chunk, result)
+                chunk = []
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if chunk:
+        await asyncio.to_thread(bulk.apply_chunk, db, chunk, result)
+    
+    return {"ok": result["failed"] == 0, **result}
+
+
+@app.get("/api/albums/export")
+def export_album_memberships():
+    """Stream every album membership and cover as NDJSON accepted by /api/albums/bulk."""
+    def lines():
+        # The request's session is closed before streaming starts, so use our own
+        with db_session() as db:
+            yield from bulk.export_lines(db)
+    
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.get("/api/albums/{album_id}", response_model=AlbumWithPhotos)
 def get_album(album_id: int, db: Session = Depends(get_db)):
     """Get a specific album with its photos."""
@@ -243,7 +691,7 @@ def update_album(album_id: int, album_data: AlbumUpdate, db: Session = Depends(g
     
     # Validate cover_photo_id if provided
     if album_data.cover_photo_id is not None:
-        photo = db.query(Photo).filter(Photo.id == album_data.cover_photo_id).first()
+        photo = db.query(Photo).filter(Photo.id == album_data.cover_photo_id, Photo.deleted_at.is_(None)).first()
         if not photo:
             raise HTTPException(status_code=400, detail="Cover photo not found")
     
@@ -272,11 +720,55 @@ def delete_album(album_id: int, db: Session = Depends(get_db)):
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     
+    db.execute(photo_albums.delete().where(photo_albums.c.album_id == album_id))
     db.delete(album)
     db.commit()
     return {"ok": True, "message": "Album deleted successfully"}
 
 
+@app.get("/api/albums/{album_id}/photos", response_model=List[PhotoResponse], responses=PHOTO_LIST_RESPONSES)
+def list_album_photos(album_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Get the photos of an album without the album details."""
+    if not db.query(Album.id).filter(Album.id == album_id).first():
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    query = (
+        db.query(Photo)
+        .join(Photo.albums)
+        .filter(Album.id == album_id)
+        .order_by(Photo.taken_at.desc(), Photo.id.desc())
+    )
+    return photo_list_response(request, response, query)
+
+
+@app.get("/api/albums/{album_id}/download")
+def download_album(album_id: int, db: Session = Depends(get_db)):
+    """Stream the album's original files as a ZIP archive."""
+    album = db.query(Album).filter(Album.id == album_id).first()
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    
+    rows = (
+        db.query(Photo.original_name, Photo.file_path, Photo.taken_at)
+        .join(Photo.albums)
+        .filter(Album.id == album_id)
+        .order_by(Photo.taken_at.asc(), Photo.id.asc())
+        .all()
+    )
+    names = archive.unique_arcnames(row.original_name for row in rows)
+    entries = [
+        archive.ArchiveEntry(name, row.file_path, row.taken_at)
+        for name, row in zip(names, rows)
+    ]
+    
+    filename = quote(f"{album.name}.zip")
+    return StreamingResponse(
+        archive.stream_zip(entries),
+        media_type="application/zip",
+        headers={"Content-Disposition": f"attachment; filename=\"album-{album_id}.zip\"; filename*=UTF-8''{filename}"}
+    )
+
+
 # Photo-Album association endpoints
 @app.post("/api/albums/{album_id}/photos")
 def add_photos_to_album(album_id: int, photo_data: PhotoAlbumAssociation, db: Session = Depends(get_db)):
@@ -286,7 +778,7 @@ def add_photos_to_album(album_id: int, photo_data: PhotoAlbumAssociation, db: Se
         raise HTTPException(status_code=404, detail="Album not found")
     
     # Validate all photo IDs exist
-    photos = db.query(Photo).filter(Photo.id.in_(photo_data.photo_ids)).all()
+    photos = db.query(Photo).filter(Photo.id.in_(photo_data.photo_ids), Photo.deleted_at.is_(None)).all()
     if len(photos) != len(photo_data.photo_ids):
         found_ids = [photo.id for photo in photos]
         missing_ids = [pid for pid in photo_data.photo_ids if pid not in found_ids]
@@ -309,7 +801,7 @@ def remove_photos_from_album(album_id: int, photo_data: PhotoAlbumAssociation, d
         raise HTTPException(status_code=404, detail="Album not found")
     
     # Validate all photo IDs exist
-    photos = db.query(Photo).filter(Photo.id.in_(photo_data.photo_ids)).all()
+    photos = db.query(Photo).filter(Photo.id.in_(photo_data.photo_ids), Photo.deleted_at.is_(None)).all()
     if len(photos) != len(photo_data.photo_ids):
         found_ids = [photo.id for photo in photos]
         missing_ids = [pid for pid in photo_data.photo_ids if pid not in found_ids]
@@ -329,7 +821,7 @@ def remove_photos_from_album(album_id: int, photo_data: PhotoAlbumAssociation, d
 @app.get("/api/photos/{photo_id}/albums", response_model=List[AlbumResponse])
 def get_photo_albums(photo_id: int, db: Session = Depends(get_db)):
     """Get all albums that contain a specific photo."""
-    photo = db.query(Photo).filter(Photo.id == photo_id).first()
+    photo = db.query(Photo).filter(Photo.id == photo_id, Photo.deleted_at.is_(None)).first()
     if not photo:
         raise HTTPException(status_code=404, detail="Photo not found")
     
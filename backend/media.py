@@ -0,0 +1,225 @@
+"""Video ingest helpers (ffmpeg) and byte-range file serving."""
+
+import json
+import os
+import subprocess
+import uuid
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional, Tuple
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFPROBE_BIN = os.getenv("FFPROBE_BIN", "ffprobe")
+TRANSCODE_TIMEOUT = int(os.getenv("TRANSCODE_TIMEOUT_SECONDS", "3600"))
+PLAYBACK_MAX_HEIGHT = int(os.getenv("PLAYBACK_MAX_HEIGHT", "1080"))
+POSTER_MAX_WIDTH = int(os.getenv("POSTER_MAX_WIDTH", "640"))
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+class MediaError(Exception):
+    """Raised when ffmpeg/ffprobe is unavailable or fails on a file."""
+
+
+def _run(args: list) -> subprocess.CompletedProcess:
+    try:
+        result = subprocess.run(args, capture_output=True, timeout=TRANSCODE_TIMEOUT)
+    except FileNotFoundError as e:
+        raise MediaError(f"{args[0]} not found") from e
+    except subprocess.TimeoutExpired as e:
+        raise MediaError(f"{args[0]} timed out") from e
+    if result.returncode != 0:
+        stderr = result.stderr.decode(errors="replace").strip().splitlines()
+        raise MediaError(stderr[-1] if stderr else f"{args[0]} exited with {result.returncode}")
+    return result
+
+
+def probe_video(path: str) -> dict:
+    """Return duration (seconds) and codec details of the first video stream."""
+    result = _run([
+        FFPROBE_BIN, "-v", "error", "-print_format", "json",
+        "-show_entries", "format=duration:stream=codec_type,codec_name,pix_fmt,height",
+        path,
+    ])
+    info = json.loads(result.stdout or b"{}")
+    video = next((s for s in info.get("streams", []) if s.get("codec_type") == "video"), None)
+    if video is None:
+        raise MediaError("No video stream found")
+    duration = info.get("format", {}).get("duration")
+    return {
+        "duration": float(duration) if duration else None,
+        "video_codec": video.get("codec_name"),
+        "pix_fmt": video.get("pix_fmt"),
+        "height": video.get("height"),
+    }
+
+
+def _tmp_sibling(dest: str) -> str:
+    # Keep the tmp_ prefix used by uploads so partial outputs are recognisable.
+    ext = dest.rsplit(".", 1)[-1]
+    return os.path.join(os.path.dirname(dest), f"tmp_{uuid.uuid4().hex}.{ext}")
+
+
+def transcode_for_web(src: str, dest: str, probe: dict) -> None:
+    """Write a browser-playable H.264/AAC MP4 with the moov atom up front.
+
+    Sources that are already H.264 yuv420p within the size limit are only
+    remuxed, which is much cheaper than a re-encode.
+    """
+    tmp = _tmp_sibling(dest)
+    compatible = (
+        probe.get("video_codec") == "h264"
+        and probe.get("pix_fmt") == "yuv420p"
+        and (probe.get("height") or 0) <= PLAYBACK_MAX_HEIGHT
+    )
+    if compatible:
+        video_args = ["-c:v", "copy"]
+    else:
+        video_args = [
+            "-c:v", "libx264", "-preset", "veryfast", "-crf", "23",
+            "-pix_fmt", "yuv420p",
+            "-vf", f"scale=-2:'min({PLAYBACK_MAX_HEIGHT},ih)'",
+        ]
+    try:
+        _run([
+            FFMPEG_BIN, "-y", "-v", "error", "-i", src,
+            "-map", "0:v:0", "-map", "0:a:0?",
+            *video_args,
+            "-c:a", "aac", "-b:a", "128k",
+            "-movflags", "+faststart",
+            tmp,
+        ])
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def extract_poster(src: str, dest: str, at: float = 0.0) -> None:
+    """Grab a single JPEG frame at `at` seconds to use as the thumbnail."""
+    tmp = _tmp_sibling(dest)
+    try:
+        _run([
+            FFMPEG_BIN, "-y", "-v", "error", "-ss", f"{at:.3f}", "-i", src,
+            "-frames:v", "1", "-vf", f"scale='min({POSTER_MAX_WIDTH},iw)':-2",
+            "-q:v", "3", tmp,
+        ])
+        os.replace(tmp, dest)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single `bytes=` range into inclusive (start, end) offsets.
+
+    Returns None when the header should be ignored (multiple ranges or an
+    unknown unit) and raises ValueError when the range is unsatisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            length = int(last)
+            if length <= 0:
+                raise ValueError("Empty suffix range")
+            start, end = max(size - length, 0), size - 1
+        else:
+            start = int(first)
+            end = int(last) if last else size - 1
+    except ValueError:
+        raise ValueError(f"Invalid range: {header}")
+    end = min(end, size - 1)
+    if start > end or start >= size:
+        raise ValueError(f"Unsatisfiable range: {header}")
+    return start, end
+
+
+def _iter_file_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(RANGE_CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def if_range_matches(if_range: Optional[str], headers) -> bool:
+    """Whether `Range` applies under the request's `If-Range` (True when absent).
+
+    An entity tag must equal the response's strong ETag and a date must
+    equal its Last-Modified; otherwise the file changed and the full
+    representation has to be sent.
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return not if_range.startswith("W/") and if_range == headers.get("etag")
+    last_modified = headers.get("last-modified")
+    try:
+        return last_modified is not None and parsedate_to_datetime(if_range) == parsedate_to_datetime(last_modified)
+    except (TypeError, ValueError):
+        return False
+
+
+def ranged_file_response(
+    path: str,
+    range_header: Optional[str],
+    stat_result: Optional[os.stat_result] = None,
+    media_type: Optional[str] = None,
+    if_range: Optional[str] = None,
+) -> Response:
+    """FileResponse that honours a single `Range` request with a 206."""
+    stat_result = stat_result or os.stat(path)
+    full = FileResponse(path, stat_result=stat_result, media_type=media_type)
+    full.headers["accept-ranges"] = "bytes"
+    if not range_header or not if_range_matches(if_range, full.headers):
+        return full
+
+    size = stat_result.st_size
+    try:
+        byte_range = parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+    if byte_range is None:
+        return full
+
+    start, end = byte_range
+    headers = {
+        "accept-ranges": "bytes",
+        "content-range": f"bytes {start}-{end}/{size}",
+        "content-length": str(end - start + 1),
+    }
+    for name in ("etag", "last-modified"):
+        if name in full.headers:
+            headers[name] = full.headers[name]
+    return StreamingResponse(
+        _iter_file_range(path, start, end),
+        status_code=206,
+        media_type=full.media_type,
+        headers=headers,
+    )
+
+
+class RangeStaticFiles(StaticFiles):
+    """StaticFiles that supports `Range` requests, so videos can be seeked."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200) -> Response:
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers.setdefault("accept-ranges", "bytes")
+        # A 304, an error page or a stale If-Range all get the plain response
+        if response.status_code != 200 or not range_header:
+            return response
+        if not if_range_matches(request_headers.get("if-range"), response.headers):
+            return response
+        return ranged_file_response(str(full_path), range_header, stat_result)
@@ -0,0 +1,24 @@
+"""Add processing_started_at for claiming video processing jobs
+
+Revision ID: 2d6f8b4a0c51
+Revises: 7b3e5a9c1d24
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2d6f8b4a0c51'
+down_revision = '7b3e5a9c1d24'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('processing_started_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'processing_started_at')
@@ -0,0 +1,32 @@
+"""Add video fields to photos
+
+Revision ID: 3f1a7c2e9b40
+Revises: b80b0d51f8aa
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f1a7c2e9b40'
+down_revision = 'b80b0d51f8aa'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('media_type', sa.String(length=10), server_default='image', nullable=False))
+    op.add_column('photos', sa.Column('duration', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('playback_filename', sa.String(length=255), nullable=True))
+    op.add_column('photos', sa.Column('poster_filename', sa.String(length=255), nullable=True))
+    op.add_column('photos', sa.Column('processing_status', sa.String(length=20), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('photos', 'processing_status')
+    op.drop_column('photos', 'poster_filename')
+    op.drop_column('photos', 'playback_filename')
+    op.drop_column('photos', 'duration')
+    op.drop_column('photos', 'media_type')
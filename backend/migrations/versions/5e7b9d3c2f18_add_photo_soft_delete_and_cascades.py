@@ -0,0 +1,42 @@
+"""Add photo soft delete and cascading album references
+
+Revision ID: 5e7b9d3c2f18
+Revises: 8c2d4e6f1a37
+Create Date: 2026-10-19 12:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e7b9d3c2f18'
+down_revision = '8c2d4e6f1a37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('deleted_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_photos_deleted_at'), 'photos', ['deleted_at'], unique=False)
+
+    # Rows left behind by album deletes before the cascade existed
+    op.execute("DELETE FROM photo_albums WHERE album_id NOT IN (SELECT id FROM albums)")
+
+    op.drop_constraint('photo_albums_photo_id_fkey', 'photo_albums', type_='foreignkey')
+    op.drop_constraint('photo_albums_album_id_fkey', 'photo_albums', type_='foreignkey')
+    op.drop_constraint('albums_cover_photo_id_fkey', 'albums', type_='foreignkey')
+    op.create_foreign_key('photo_albums_photo_id_fkey', 'photo_albums', 'photos', ['photo_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('photo_albums_album_id_fkey', 'photo_albums', 'albums', ['album_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key('albums_cover_photo_id_fkey', 'albums', 'photos', ['cover_photo_id'], ['id'], ondelete='SET NULL')
+
+
+def downgrade() -> None:
+    op.drop_constraint('albums_cover_photo_id_fkey', 'albums', type_='foreignkey')
+    op.drop_constraint('photo_albums_album_id_fkey', 'photo_albums', type_='foreignkey')
+    op.drop_constraint('photo_albums_photo_id_fkey', 'photo_albums', type_='foreignkey')
+    op.create_foreign_key('albums_cover_photo_id_fkey', 'albums', 'photos', ['cover_photo_id'], ['id'])
+    op.create_foreign_key('photo_albums_album_id_fkey', 'photo_albums', 'albums', ['album_id'], ['id'])
+    op.create_foreign_key('photo_albums_photo_id_fkey', 'photo_albums', 'photos', ['photo_id'], ['id'])
+    op.drop_index(op.f('ix_photos_deleted_at'), table_name='photos')
+    op.drop_column('photos', 'deleted_at')
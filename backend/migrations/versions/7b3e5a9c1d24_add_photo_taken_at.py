@@ -0,0 +1,38 @@
+"""Add photo capture time and key the timeline on it
+
+Revision ID: 7b3e5a9c1d24
+Revises: a4f2c8e1d955
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7b3e5a9c1d24'
+down_revision = 'a4f2c8e1d955'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('taken_at', sa.DateTime(), nullable=True))
+    # Until EXIF is read (python timeline.py backfill), photos stay at their upload time,
+    # so the existing photo_timeline buckets remain correct
+    op.execute("UPDATE photos SET taken_at = COALESCE(uploaded_at, created_at, now())")
+    op.create_index('ix_photos_taken_at_id', 'photos', ['taken_at', 'id'], unique=False)
+    op.drop_index('ix_photos_uploaded_at_id', table_name='photos')
+
+
+def downgrade() -> None:
+    op.create_index('ix_photos_uploaded_at_id', 'photos', ['uploaded_at', 'id'], unique=False)
+    op.drop_index('ix_photos_taken_at_id', table_name='photos')
+    op.drop_column('photos', 'taken_at')
+    op.execute("DELETE FROM photo_timeline")
+    op.execute(
+        "INSERT INTO photo_timeline (year, month, count) "
+        "SELECT EXTRACT(YEAR FROM uploaded_at)::int, EXTRACT(MONTH FROM uploaded_at)::int, COUNT(*) "
+        "FROM photos WHERE uploaded_at IS NOT NULL AND deleted_at IS NULL "
+        "GROUP BY 1, 2"
+    )
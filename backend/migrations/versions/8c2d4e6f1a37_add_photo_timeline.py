@@ -0,0 +1,38 @@
+"""Add photo_timeline buckets and keyset index on photos
+
+Revision ID: 8c2d4e6f1a37
+Revises: 3f1a7c2e9b40
+Create Date: 2026-10-19 11:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8c2d4e6f1a37'
+down_revision = '3f1a7c2e9b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('photo_timeline',
+    sa.Column('year', sa.Integer(), nullable=False),
+    sa.Column('month', sa.Integer(), nullable=False),
+    sa.Column('count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('year', 'month')
+    )
+    op.create_index('ix_photos_uploaded_at_id', 'photos', ['uploaded_at', 'id'], unique=False)
+    # Backfill from existing photos
+    op.execute(
+        "INSERT INTO photo_timeline (year, month, count) "
+        "SELECT EXTRACT(YEAR FROM uploaded_at)::int, EXTRACT(MONTH FROM uploaded_at)::int, COUNT(*) "
+        "FROM photos WHERE uploaded_at IS NOT NULL "
+        "GROUP BY 1, 2"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_uploaded_at_id', table_name='photos')
+    op.drop_table('photo_timeline')
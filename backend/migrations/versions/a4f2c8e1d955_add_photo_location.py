@@ -0,0 +1,30 @@
+"""Add photo location and geohash index
+
+Revision ID: a4f2c8e1d955
+Revises: 5e7b9d3c2f18
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4f2c8e1d955'
+down_revision = '5e7b9d3c2f18'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('photos', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index(op.f('ix_photos_geohash'), 'photos', ['geohash'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_photos_geohash'), table_name='photos')
+    op.drop_column('photos', 'geohash')
+    op.drop_column('photos', 'longitude')
+    op.drop_column('photos', 'latitude')
@@ -1,7 +1,7 @@
 """Database models for the family homepage application."""
 
 from datetime import datetime
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey, Table
+from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, Float, ForeignKey, Table, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
@@ -12,8 +12,8 @@ Base = declarative_base()
 photo_albums = Table(
     'photo_albums',
     Base.metadata,
-    Column('photo_id', Integer, ForeignKey('photos.id'), primary_key=True),
-    Column('album_id', Integer, ForeignKey('albums.id'), primary_key=True)
+    Column('photo_id', Integer, ForeignKey('photos.id', ondelete='CASCADE'), primary_key=True),
+    Column('album_id', Integer, ForeignKey('albums.id', ondelete='CASCADE'), primary_key=True)
 )
 
 
@@ -28,12 +28,40 @@ class Photo(Base):
     file_size = Column(Integer)
     mime_type = Column(String(100))
     description = Column(Text)
+    # "image" or "video"; videos get a web rendition and poster frame in the background
+    media_type = Column(String(10), nullable=False, default="image", server_default="image")
+    duration = Column(Float)
+    playback_filename = Column(String(255))
+    poster_filename = Column(String(255))
+    processing_status = Column(String(20))
+    # Set when a worker claims the video; "processing" rows older than the stale limit are re-claimable
+    processing_started_at = Column(DateTime)
+    # GPS position (EXIF or set manually); geohash is B-tree indexed for map queries
+    latitude = Column(Float)
+    longitude = Column(Float)
+    geohash = Column(String(12), index=True)
+    # Soft delete: set on DELETE, files and row are purged by the background sweeper
+    deleted_at = Column(DateTime, index=True)
     uploaded_at = Column(DateTime, default=func.now())
+    # Capture time: EXIF DateTimeOriginal, else uploaded_at; timelines and lists are ordered by it
+    taken_at = Column(DateTime, default=func.now())
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
     # Many-to-Many relationship with Album
     albums = relationship("Album", secondary=photo_albums, back_populates="photos")
+    
+    # Keyset pagination order for photo lists and timeline cursors
+    __table_args__ = (Index("ix_photos_taken_at_id", "taken_at", "id"),)
+
+
+class PhotoTimeline(Base):
+    """Photo counts per upload year/month, maintained on upload/delete."""
+    __tablename__ = "photo_timeline"
+    
+    year = Column(Integer, primary_key=True)
+    month = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
 
 
 class Album(Base):
@@ -43,7 +71,7 @@ class Album(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=False, index=True)
     description = Column(Text)
-    cover_photo_id = Column(Integer, ForeignKey('photos.id'), nullable=True)
+    cover_photo_id = Column(Integer, ForeignKey('photos.id', ondelete='SET NULL'), nullable=True)
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
     
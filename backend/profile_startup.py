@@ -0,0 +1,102 @@
+"""Report import-time breakdown and time to the first healthy response.
+
+Usage: python profile_startup.py [--top 25]
+
+Each measurement runs in a fresh interpreter so nothing is already
+imported or cached.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+FIRST_HEALTH_SNIPPET = """
+import json, time
+t0 = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+t1 = time.perf_counter()
+with TestClient(main.app) as client:
+    t2 = time.perf_counter()
+    response = client.get("/api/health")
+    t3 = time.perf_counter()
+print(json.dumps({
+    "status": response.status_code,
+    "database": response.json().get("database"),
+    "import": t1 - t0,
+    "startup": t2 - t1,
+    "first_response": t3 - t2,
+}))
+"""
+
+
+def parse_importtime(stderr: str) -> list:
+    """Parse `-X importtime` output into (module, self_us, cumulative_us, depth)."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def import_profile(env=None) -> list:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import main"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return parse_importtime(result.stderr)
+
+
+def measure_startup(env=None) -> dict:
+    """Time a cold `import main`, app startup and first /api/health, in seconds.
+
+    Also returns the response status and its `database` check, since
+    /api/health answers 200 even when the DB is unreachable.
+    """
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-c", FIRST_HEALTH_SNIPPET],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    total = time.perf_counter() - start
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    timings["total"] = total
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=25)
+    args = parser.parse_args()
+
+    rows = import_profile()
+    by_package = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        by_package[name.split(".")[0]] += self_us
+    total_us = sum(by_package.values())
+
+    print(f"Import time by top-level package (total {total_us / 1000:.1f} ms)")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"  {package:<32} {self_us / 1000:>8.1f} ms {100 * self_us / total_us:>5.1f}%")
+
+    print("\nSlowest modules by cumulative time")
+    for name, _, cumulative_us, depth in sorted(rows, key=lambda row: -row[2])[:args.top]:
+        print(f"  {'  ' * depth}{name:<{48 - 2 * depth}} {cumulative_us / 1000:>8.1f} ms")
+
+    timings = measure_startup()
+    print(f"\nTime to first healthy response (status {timings['status']}, database {timings['database']})")
+    for key in ("import", "startup", "first_response", "total"):
+        print(f"  {key:<16} {timings[key] * 1000:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
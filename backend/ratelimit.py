@@ -0,0 +1,291 @@
+"""Token-bucket rate limiting and in-flight caps for upload/write endpoints.
+
+Limits are configured per route group with RATE_LIMITS, e.g.
+``upload=0.5/10/2/8,write=5/50/0/16``, where each value is
+``tokens_per_second/burst/per_client_in_flight/global_in_flight`` and a
+0 disables that part. State lives in process memory unless
+RATE_LIMIT_REDIS_URL points at a shared Redis; in memory every worker
+keeps its own buckets and counts, so with N workers a client can get up to
+N times the configured limits.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Callable, Optional, Tuple
+
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+@dataclass
+class RouteGroup:
+    """Limits applied to requests matched by `match(method, path)`."""
+    name: str
+    match: Callable[[str, str], bool]
+    rate: float = 0.0          # tokens per second, 0 = no rate limit
+    burst: int = 0             # bucket capacity
+    per_client: int = 0        # concurrent requests per client, 0 = unlimited
+    global_limit: int = 0      # concurrent requests across all clients, 0 = unlimited
+
+
+# Generous buckets so a household's batch upload (often one NAT address) goes
+# through; the in-flight caps are what protect the server
+DEFAULT_LIMITS = "upload=5/500/4/8,write=20/200/0/16"
+
+ROUTE_MATCHERS = {
+    "upload": lambda method, path: method == "POST" and path == "/api/photos/upload",
+    "write": lambda method, path: method not in READ_METHODS and path.startswith("/api/"),
+}
+
+
+def parse_limits(spec: str) -> list:
+    """Build RouteGroups from a RATE_LIMITS string, keeping ROUTE_MATCHERS order."""
+    values = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        name, _, numbers = item.partition("=")
+        if name not in ROUTE_MATCHERS:
+            raise ValueError(f"Unknown rate limit group: {name}")
+        parts = (numbers.split("/") + ["0"] * 4)[:4]
+        values[name] = (float(parts[0]), int(parts[1]), int(parts[2]), int(parts[3]))
+    return [
+        RouteGroup(name, matcher, *values[name])
+        for name, matcher in ROUTE_MATCHERS.items()
+        if name in values
+    ]
+
+
+class MemoryBackend:
+    """Per-process state; also the local stand-in for the shared backend."""
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}   # key -> (tokens, updated_at, full_at)
+        self._in_flight = defaultdict(int)
+        self._calls = 0
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        """Take one token; returns (allowed, seconds until a token is available)."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, _ = self._buckets.get(key, (float(burst), now, 0))
+            tokens = min(float(burst), tokens + (now - updated) * rate)
+            if tokens >= 1:
+                tokens, allowed, wait = tokens - 1, True, 0.0
+            else:
+                allowed, wait = False, (1 - tokens) / rate
+            # After this long the bucket is full again and can be forgotten
+            self._buckets[key] = (tokens, now, now + (burst - tokens) / rate)
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                self._prune(now)
+        return allowed, wait
+
+    def _prune(self, now: float):
+        for key, (_, _, full_at) in list(self._buckets.items()):
+            if now >= full_at:
+                del self._buckets[key]
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        with self._lock:
+            if self._in_flight[key] >= limit:
+                return False
+            self._in_flight[key] += 1
+            return True
+
+    async def release(self, key: str):
+        with self._lock:
+            self._in_flight[key] -= 1
+            if self._in_flight[key] <= 0:
+                del self._in_flight[key]
+
+
+class RedisBackend:
+    """Shared state across workers/containers, using redis.asyncio."""
+
+    TAKE_SCRIPT = """
+    local tokens = tonumber(redis.call('HGET', KEYS[1], 't') or ARGV[2])
+    local updated = tonumber(redis.call('HGET', KEYS[1], 'u') or ARGV[3])
+    local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+    tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= 1 then tokens = tokens - 1; allowed = 1 end
+    redis.call('HSET', KEYS[1], 't', tokens, 'u', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+    # The TTL is set when the counter is created (and the key deleted when it
+    # drops back to 0), so a crashed worker's slots expire instead of being
+    # kept alive by every later request
+    ACQUIRE_SCRIPT = """
+    local count = redis.call('INCR', KEYS[1])
+    if count == 1 then redis.call('EXPIRE', KEYS[1], ARGV[2]) end
+    if count > tonumber(ARGV[1]) then redis.call('DECR', KEYS[1]); return 0 end
+    return 1
+    """
+    RELEASE_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 1 and redis.call('DECR', KEYS[1]) <= 0 then
+        redis.call('DEL', KEYS[1])
+    end
+    """
+    IN_FLIGHT_TTL = 3600
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis
+        self._redis = redis.from_url(url)
+        self._take = self._redis.register_script(self.TAKE_SCRIPT)
+        self._acquire = self._redis.register_script(self.ACQUIRE_SCRIPT)
+        self._release = self._redis.register_script(self.RELEASE_SCRIPT)
+
+    async def take(self, key: str, rate: float, burst: int) -> Tuple[bool, float]:
+        allowed, tokens = await self._take(keys=[f"rl:bucket:{key}"], args=[rate, burst, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / rate
+
+    async def acquire(self, key: str, limit: int) -> bool:
+        return bool(await self._acquire(keys=[f"rl:inflight:{key}"], args=[limit, self.IN_FLIGHT_TTL]))
+
+    async def release(self, key: str):
+        await self._release(keys=[f"rl:inflight:{key}"])
+
+
+def create_backend(url: Optional[str]):
+    if not url:
+        return MemoryBackend()
+    try:
+        return RedisBackend(url)
+    except ImportError as exc:
+        # Silently falling back would multiply the limits by the number of workers
+        raise RuntimeError("RATE_LIMIT_REDIS_URL is set but the redis package is not installed") from exc
+
+
+@dataclass
+class RateLimitMetrics:
+    allowed: dict = field(default_factory=lambda: defaultdict(int))
+    rate_limited: dict = field(default_factory=lambda: defaultdict(int))
+    concurrency_limited: dict = field(default_factory=lambda: defaultdict(int))
+    in_flight: dict = field(default_factory=lambda: defaultdict(int))
+
+    def render(self) -> str:
+        """Prometheus text exposition format."""
+        lines = []
+        for metric, kind, values in (
+            ("ratelimit_allowed_total", "counter", self.allowed),
+            ("ratelimit_rate_limited_total", "counter", self.rate_limited),
+            ("ratelimit_concurrency_limited_total", "counter", self.concurrency_limited),
+            ("ratelimit_in_flight", "gauge", self.in_flight),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            lines.extend(f'{metric}{{group="{group}"}} {value}' for group, value in sorted(values.items()))
+        return "\n".join(lines) + "\n"
+
+
+class RateLimiter:
+    def __init__(self, groups: list, backend=None, trust_proxy: bool = True, backend_url: Optional[str] = None):
+        self.groups = groups
+        self._backend = backend
+        self.backend_url = backend_url
+        self.trust_proxy = trust_proxy
+        self.metrics = RateLimitMetrics()
+
+    @property
+    def backend(self):
+        # Created lazily so importing main does not import the redis client
+        if self._backend is None:
+            self._backend = create_backend(self.backend_url)
+        return self._backend
+
+    @backend.setter
+    def backend(self, backend):
+        self._backend = backend
+
+    def check_backend(self):
+        """Create a configured Redis backend now, so a missing client fails startup."""
+        if self.backend_url:
+            self.backend
+
+    @classmethod
+    def from_env(cls) -> "RateLimiter":
+        return cls(
+            parse_limits(os.getenv("RATE_LIMITS", DEFAULT_LIMITS)),
+            trust_proxy=os.getenv("RATE_LIMIT_TRUST_PROXY", "true").lower() == "true",
+            backend_url=os.getenv("RATE_LIMIT_REDIS_URL"),
+        )
+
+    def group_for(self, method: str, path: str) -> Optional[RouteGroup]:
+        return next((g for g in self.groups if g.match(method, path)), None)
+
+    def client_id(self, scope) -> str:
+        if self.trust_proxy:
+            headers = dict(scope.get("headers") or [])
+            real_ip = headers.get(b"x-real-ip")
+            if real_ip:
+                return real_ip.decode("latin-1").strip()
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+
+class RateLimitMiddleware:
+    """ASGI middleware rejecting over-limit requests with 429 + Retry-After.
+
+    Concurrency slots are held until the response has been sent, so slow
+    uploads count against their client for their whole duration.
+    """
+
+    def __init__(self, app, limiter: RateLimiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        group = self.limiter.group_for(scope["method"], scope["path"])
+        if group is None:
+            return await self.app(scope, receive, send)
+
+        backend, metrics = self.limiter.backend, self.limiter.metrics
+        client = self.limiter.client_id(scope)
+
+        if group.rate > 0:
+            allowed, wait = await backend.take(f"{group.name}:{client}", group.rate, max(group.burst, 1))
+            if not allowed:
+                metrics.rate_limited[group.name] += 1
+                return await self._reject(send, wait, "Too many requests")
+
+        held = []
+        try:
+            for key, limit in ((f"{group.name}:{client}", group.per_client), (f"{group.name}:*", group.global_limit)):
+                if limit > 0:
+                    if not await backend.acquire(key, limit):
+                        metrics.concurrency_limited[group.name] += 1
+                        return await self._reject(send, 1, "Too many concurrent requests")
+                    held.append(key)
+            metrics.allowed[group.name] += 1
+            metrics.in_flight[group.name] += 1
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                metrics.in_flight[group.name] -= 1
+        finally:
+            for key in held:
+                await backend.release(key)
+
+    @staticmethod
+    async def _reject(send, retry_after: float, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
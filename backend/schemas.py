@@ -1,8 +1,8 @@
 """Pydantic schemas for request/response models."""
 
 from datetime import datetime
-from pydantic import BaseModel
-from typing import Optional, List
+from pydantic import BaseModel, Field, model_validator
+from typing import Optional, List, Literal
 
 
 # Photo schemas
@@ -14,18 +14,55 @@ class PhotoCreate(PhotoBase):
     pass
 
 
+class PhotoUpdate(BaseModel):
+    description: Optional[str] = None
+    latitude: Optional[float] = Field(None, ge=-90, le=90)
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+
 class PhotoResponse(PhotoBase):
     id: int
     filename: str
     original_name: str
     file_size: Optional[int] = None
     mime_type: Optional[str] = None
+    media_type: str = "image"
+    duration: Optional[float] = None
+    playback_filename: Optional[str] = None
+    poster_filename: Optional[str] = None
+    processing_status: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     uploaded_at: datetime
+    taken_at: Optional[datetime] = None
     
     class Config:
         from_attributes = True
 
 
+# Timeline schemas
+class TimelineBucket(BaseModel):
+    year: int
+    month: int
+    count: int
+    cursor: str
+
+
+class TimelineResponse(BaseModel):
+    total: int
+    buckets: List[TimelineBucket]
+
+
+# Map schemas
+class GeoCluster(BaseModel):
+    geohash: str
+    count: int
+    latitude: float
+    longitude: float
+    # Representative photo (the only one when count == 1)
+    photo_id: int
+
+
 # Event schemas
 class EventBase(BaseModel):
     title: str
@@ -93,6 +130,42 @@ class PhotoAlbumAssociation(BaseModel):
     photo_ids: List[int]
 
 
+class AlbumBulkOperation(BaseModel):
+    op: Literal["copy", "move", "remove", "set_cover"]
+    photo_ids: List[int] = []
+    from_album: Optional[int] = Field(None, alias="from")
+    to_album: Optional[int] = Field(None, alias="to")
+    album_id: Optional[int] = None
+    photo_id: Optional[int] = None
+
+    @model_validator(mode="after")
+    def check_required_fields(self):
+        required = {
+            "copy": ("to_album",),
+            "move": ("from_album", "to_album"),
+            "remove": ("from_album",),
+            "set_cover": ("album_id", "photo_id"),
+        }[self.op]
+        missing = [self.model_fields[name].alias or name for name in required if getattr(self, name) is None]
+        if missing:
+            raise ValueError(f"'{self.op}' requires {', '.join(missing)}")
+        return self
+
+
+class AlbumBulkResult(BaseModel):
+    ok: bool
+    applied: int
+    failed: int
+    added: int
+    removed: int
+    covers_set: int
+    errors: List[dict] = []
+
+
+class PhotoBulkDelete(BaseModel):
+    photo_ids: List[int]
+
+
 # Update PhotoResponse to include albums if needed
 class PhotoWithAlbums(PhotoResponse):
     albums: List['AlbumResponse'] = []
@@ -0,0 +1,151 @@
+"""Photo soft-deletion and background garbage collection of files on disk.
+
+Deleting a photo only marks the row (deleted_at) and detaches it from
+albums; the marked rows are the removal queue. `purge_deleted` removes
+their files and then the rows, and `sweep_orphans` reconciles PHOTOS_DIR
+against the DB, removing unreferenced files and stale `tmp_*` uploads.
+Both work in bounded batches so a sweep never holds the DB or disk for
+long.
+"""
+
+import logging
+import os
+import time
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from sqlalchemy import delete, extract, func, select, update
+from sqlalchemy.orm import Session
+
+import timeline
+from models import Album, Photo, photo_albums
+
+logger = logging.getLogger(__name__)
+
+
+def soft_delete_photos(db: Session, photo_ids: Iterable[int]) -> List[int]:
+    """Mark photos deleted, detach them from albums and fix timeline counts.
+
+    Returns the ids that were actually deleted (already deleted or unknown
+    ids are ignored). Commits the transaction.
+    """
+    ids = [
+        row.id for row in db.query(Photo.id)
+        .filter(Photo.id.in_(list(photo_ids)), Photo.deleted_at.is_(None))
+        .with_for_update()
+    ]
+    if not ids:
+        return []
+
+    year, month = extract("year", Photo.taken_at), extract("month", Photo.taken_at)
+    buckets = db.execute(
+        select(year, month, func.count())
+        .where(Photo.id.in_(ids), Photo.taken_at.isnot(None))
+        .group_by(year, month)
+    ).all()
+
+    db.execute(update(Photo).where(Photo.id.in_(ids)).values(deleted_at=func.now()))
+    db.execute(delete(photo_albums).where(photo_albums.c.photo_id.in_(ids)))
+    db.execute(update(Album).where(Album.cover_photo_id.in_(ids)).values(cover_photo_id=None))
+    for y, m, count in buckets:
+        timeline.bump(db, datetime(int(y), int(m), 1), -count)
+    db.commit()
+    return ids
+
+
+def _remove(path: str) -> bool:
+    try:
+        os.remove(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def _photo_files(photo: Photo, photos_dir: str) -> List[str]:
+    names = [photo.playback_filename, photo.poster_filename]
+    return [photo.file_path] + [os.path.join(photos_dir, n) for n in names if n]
+
+
+def _remove_variants(variants_dir: Optional[str], filenames: List[str]):
+    if not variants_dir or not os.path.isdir(variants_dir):
+        return
+    prefixes = tuple(f"{os.path.splitext(name)[0]}_" for name in filenames)
+    for entry in os.scandir(variants_dir):
+        if entry.name.startswith(prefixes):
+            _remove(entry.path)
+
+
+def purge_deleted(db: Session, photos_dir: str, variants_dir: Optional[str] = None, batch_size: int = 500) -> int:
+    """Remove files of soft-deleted photos, then the rows. Returns rows purged."""
+    photos = (
+        db.query(Photo)
+        .filter(Photo.deleted_at.isnot(None))
+        .order_by(Photo.deleted_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    if not photos:
+        return 0
+
+    filenames = []
+    for photo in photos:
+        for path in _photo_files(photo, photos_dir):
+            _remove(path)
+        filenames += [n for n in (photo.filename, photo.poster_filename) if n]
+    _remove_variants(variants_dir, filenames)
+
+    db.execute(delete(Photo).where(Photo.id.in_([p.id for p in photos])))
+    db.commit()
+    logger.info("Purged %d deleted photos", len(photos))
+    return len(photos)
+
+
+def sweep_orphans(db: Session, photos_dir: str, batch_size: int = 500, min_age: int = 3600) -> int:
+    """Remove files in `photos_dir` no photo row refers to. Returns files removed.
+
+    Only files older than `min_age` seconds are considered, so uploads
+    between their final move and commit are never touched. Hidden entries
+    (e.g. the variant cache) are skipped, as are `{stem}_*` outputs of
+    videos still being processed, whose names are only stored once the
+    transcode finishes.
+    """
+    cutoff = time.time() - min_age
+    removed = 0
+    candidates = []
+
+    def flush():
+        nonlocal removed
+        names = [entry.name for entry in candidates]
+        known = set()
+        for column in (Photo.filename, Photo.playback_filename, Photo.poster_filename):
+            known.update(value for (value,) in db.query(column).filter(column.in_(names)))
+        processing = tuple(
+            f"{os.path.splitext(filename)[0]}_" for (filename,) in
+            db.query(Photo.filename).filter(Photo.processing_status.in_(("pending", "processing")))
+        )
+        for entry in candidates:
+            if entry.name not in known and not entry.name.startswith(processing) and _remove(entry.path):
+                removed += 1
+        candidates.clear()
+
+    with os.scandir(photos_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file(follow_symlinks=False):
+                continue
+            if entry.stat(follow_symlinks=False).st_mtime > cutoff:
+                continue
+            if entry.name.startswith("tmp_"):
+                # Interrupted uploads and transcodes
+                removed += _remove(entry.path)
+            else:
+                candidates.append(entry)
+                if len(candidates) >= batch_size:
+                    flush()
+            if removed >= batch_size:
+                break
+    if candidates and removed < batch_size:
+        flush()
+    if removed:
+        logger.info("Removed %d orphaned files from %s", removed, photos_dir)
+    return removed
@@ -1,12 +1,28 @@
 """Test cases for FastAPI application"""
+import asyncio
+import io
+import json
 import os
+import subprocess
+import sys
 import tempfile
+import time
+import zipfile
 import pytest
 from fastapi.testclient import TestClient
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+import backup
+import encoding
+import imaging
+import geo
 import main
-from models import Base
+import profile_startup
+import ratelimit
+import sweeper
+import timeline
+from datetime import datetime, timedelta
+from models import Base, Photo, photo_albums
 
 
 # Test database setup
@@ -203,4 +219,648 @@ def test_event_validation(client):
     }
     
     response = client.post("/api/events", json=invalid_event)
-    assert response.status_code == 422  # Validation error
\ No newline at end of file
+    assert response.status_code == 422  # Validation error
+
+def wait_for_processing(client, photo_id, timeout=10):
+    """Poll until the transcode workers are done with a video"""
+    deadline = time.monotonic() + timeout
+    while True:
+        photos = client.get("/api/photos").json()
+        video = next(p for p in photos if p["id"] == photo_id)
+        if video["processing_status"] not in ("pending", "processing") or time.monotonic() > deadline:
+            return video
+        time.sleep(0.05)
+
+
+def test_video_upload(client):
+    """Test video upload is accepted and queued for background processing"""
+    response = client.post(
+        "/api/photos/upload",
+        files={"file": ("clip.mp4", b"not really a video", "video/mp4")}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["media_type"] == "video"
+    assert data["processing_status"] == "pending"
+
+    # Without a real video processing cannot succeed
+    assert wait_for_processing(client, data["id"])["processing_status"] == "failed"
+
+
+def test_unfinished_videos_are_requeued(client, monkeypatch):
+    """Test videos left processing are re-queued and unexpected errors mark them failed"""
+    def broken_probe(path):
+        raise ValueError("unexpected ffprobe output")
+    monkeypatch.setattr(main.media, "probe_video", broken_probe)
+
+    db = TestingSessionLocal()
+    try:
+        stale = datetime.utcnow() - timedelta(seconds=main.VIDEO_CLAIM_STALE_SECONDS + 60)
+        video = Photo(filename="stuck.mp4", original_name="stuck.mp4", file_path="/nonexistent/stuck.mp4",
+                      media_type="video", processing_status="processing", processing_started_at=stale)
+        # Claimed a moment ago by another worker
+        busy = Photo(filename="busy.mp4", original_name="busy.mp4", file_path="/nonexistent/busy.mp4",
+                     media_type="video", processing_status="processing", processing_started_at=datetime.utcnow())
+        db.add_all([video, busy])
+        db.commit()
+        video_id, busy_id = video.id, busy.id
+    finally:
+        db.close()
+
+    main.requeue_videos()
+    assert wait_for_processing(client, video_id)["processing_status"] == "failed"
+
+    # Duplicate jobs (another worker's requeue) lose the claim and leave rows alone
+    main.process_video(busy_id)
+    main.process_video(video_id)
+    photos = {p["id"]: p for p in client.get("/api/photos").json()}
+    assert photos[busy_id]["processing_status"] == "processing"
+    assert photos[video_id]["processing_status"] == "failed"
+
+
+def test_photo_range_request(client):
+    """Test partial content is served for Range requests"""
+    response = client.post(
+        "/api/photos/upload",
+        files={"file": ("range.jpg", b"0123456789", "image/jpeg")}
+    )
+    assert response.status_code == 200
+    filename = response.json()["filename"]
+
+    response = client.get(f"/data/photos/{filename}", headers={"Range": "bytes=2-5"})
+    assert response.status_code == 206
+    assert response.content == b"2345"
+    assert response.headers["content-range"] == "bytes 2-5/10"
+
+    response = client.get(f"/data/photos/{filename}", headers={"Range": "bytes=20-"})
+    assert response.status_code == 416
+
+    response = client.get(f"/data/photos/{filename}")
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+
+    # If-Range: the range is only served while the validator still matches
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+    for validator, status, body in [
+        (etag, 206, b"2345"),
+        (last_modified, 206, b"2345"),
+        ('"stale"', 200, b"0123456789"),
+        (f"W/{etag}", 200, b"0123456789"),
+        ("Mon, 01 Jan 2001 00:00:00 GMT", 200, b"0123456789"),
+    ]:
+        response = client.get(f"/data/photos/{filename}", headers={"Range": "bytes=2-5", "If-Range": validator})
+        assert (response.status_code, response.content) == (status, body)
+
+
+def test_album_download_zip(client):
+    """Test album download streams a ZIP of the original files"""
+    album = client.post("/api/albums", json={"name": "Download Album"}).json()
+    photo_ids = []
+    for content in (b"first photo", b"second photo"):
+        response = client.post(
+            "/api/photos/upload",
+            files={"file": ("same-name.jpg", content, "image/jpeg")}
+        )
+        assert response.status_code == 200
+        photo_ids.append(response.json()["id"])
+    client.post(f"/api/albums/{album['id']}/photos", json={"photo_ids": photo_ids})
+
+    response = client.get(f"/api/albums/{album['id']}/download")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/zip"
+
+    archive = zipfile.ZipFile(io.BytesIO(response.content))
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == ["same-name (2).jpg", "same-name.jpg"]
+    assert all(info.compress_type == zipfile.ZIP_STORED for info in archive.infolist())
+    assert sorted(archive.read(n) for n in archive.namelist()) == [b"first photo", b"second photo"]
+
+    assert client.get("/api/albums/99999/download").status_code == 404
+
+
+def test_photo_image_negotiation(client):
+    """Test photo variants follow the Accept header and requested width"""
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (1200, 800), "red").save(buffer, format="JPEG")
+    response = client.post(
+        "/api/photos/upload",
+        files={"file": ("big.jpg", buffer.getvalue(), "image/jpeg")}
+    )
+    photo_id = response.json()["id"]
+
+    response = client.get(f"/api/photos/{photo_id}/image", headers={"Accept": "image/webp,*/*"}, params={"w": 300})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+    assert "Accept" in response.headers["vary"]
+    assert Image.open(io.BytesIO(response.content)).width == 320
+
+    response = client.get(f"/api/photos/{photo_id}/image", headers={"Accept": "image/jpeg", "Sec-CH-Width": "500"})
+    assert response.headers["content-type"] == "image/jpeg"
+    assert Image.open(io.BytesIO(response.content)).width == 640
+
+    # No hints and an acceptable original: served as-is
+    response = client.get(f"/api/photos/{photo_id}/image", headers={"Accept": "image/jpeg"})
+    assert response.content == buffer.getvalue()
+
+    assert client.get("/api/photos/99999/image").status_code == 404
+
+
+def test_unsized_variant_is_capped_and_encodes_are_bounded(client, monkeypatch):
+    """Test variants requested without a width are capped and busy encoders fall back to the original"""
+    Image = pytest.importorskip("PIL.Image")
+    buffer = io.BytesIO()
+    Image.new("RGB", (4000, 8), "green").save(buffer, format="JPEG")
+    photo_id = client.post("/api/photos/upload", files={"file": ("wide.jpg", buffer.getvalue(), "image/jpeg")}).json()["id"]
+
+    response = client.get(f"/api/photos/{photo_id}/image", headers={"Accept": "image/webp"})
+    assert response.headers["content-type"] == "image/webp"
+    assert Image.open(io.BytesIO(response.content)).width == imaging.WIDTH_BUCKETS[-1]
+
+    # All slots taken: the original is served instead of queueing another encode
+    slots = imaging.threading.BoundedSemaphore(1)
+    slots.acquire()
+    monkeypatch.setattr(imaging, "ENCODE_SLOTS", slots)
+    monkeypatch.setattr(imaging, "ENCODE_WAIT_SECONDS", 0)
+    response = client.get(f"/api/photos/{photo_id}/image", headers={"Accept": "image/webp"}, params={"w": 100})
+    assert response.content == buffer.getvalue()
+
+
+def test_rotated_jpeg_variant_width(tmp_path):
+    """Test portrait JPEGs stored sideways (EXIF orientation 6) reach the requested width"""
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    path = tmp_path / "portrait.jpg"
+    Image.new("RGB", (2000, 1500), "blue").save(path, format="JPEG", exif=exif)
+
+    variant = Image.open(io.BytesIO(imaging.encode_variant(str(path), 480, "jpeg")))
+    assert variant.size == (480, 640)
+
+
+def test_variant_cache_lru_eviction(tmp_path):
+    """Test the variant cache evicts least recently used entries by size"""
+    cache = imaging.VariantCache(str(tmp_path), max_bytes=25)
+    cache.put("a", b"x" * 10)
+    cache.put("b", b"x" * 10)
+    assert cache.get("a")  # "b" is now least recently used
+    cache.put("c", b"x" * 10)
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.total_bytes == 20
+    assert sorted(os.listdir(tmp_path)) == ["a", "c"]
+
+    # A second worker sharing the directory sees the other's files and evicts against them
+    other = imaging.VariantCache(str(tmp_path), max_bytes=25, rescan_seconds=0)
+    assert other.get("a")
+    os.remove(tmp_path / "c")  # e.g. removed by the sweeper
+    other.put("e", b"x" * 10)
+    assert sorted(os.listdir(tmp_path)) == ["a", "e"]
+    cache.put("f", b"x" * 10)
+    files = os.listdir(tmp_path)
+    assert len(files) == 2 and "f" in files
+    assert cache.total_bytes == 20
+
+    calls = []
+    cache.get_or_create("d", lambda: calls.append(1) or b"y")
+    cache.get_or_create("d", lambda: calls.append(1) or b"y")
+    assert calls == [1]
+
+
+def test_upload_rate_limit(client, monkeypatch):
+    """Test upload bursts are rejected with 429 and Retry-After"""
+    monkeypatch.setattr(main.rate_limiter, "groups", ratelimit.parse_limits("upload=0.01/2/1/0"))
+    monkeypatch.setattr(main.rate_limiter, "backend", ratelimit.MemoryBackend())
+
+    statuses = [
+        client.post("/api/photos/upload", files={"file": ("x.txt", b"x", "text/plain")}).status_code
+        for _ in range(3)
+    ]
+    assert statuses == [400, 400, 429]
+
+    response = client.post("/api/photos/upload", files={"file": ("x.txt", b"x", "text/plain")})
+    assert response.status_code == 429
+    assert int(response.headers["retry-after"]) >= 1
+
+    # Reads are never limited
+    assert client.get("/api/photos").status_code == 200
+
+    metrics = client.get("/api/metrics").text
+    assert 'ratelimit_rate_limited_total{group="upload"} 2' in metrics
+
+
+def test_concurrency_limit(monkeypatch):
+    """Test per-client in-flight slots are released after the request finishes"""
+    backend = ratelimit.MemoryBackend()
+
+    async def scenario():
+        assert await backend.acquire("upload:1.2.3.4", 1)
+        assert not await backend.acquire("upload:1.2.3.4", 1)
+        assert await backend.acquire("upload:5.6.7.8", 1)
+        await backend.release("upload:1.2.3.4")
+        assert await backend.acquire("upload:1.2.3.4", 1)
+
+    asyncio.run(scenario())
+
+    # A configured Redis without the client installed fails startup instead of going per-worker
+    monkeypatch.setitem(sys.modules, "redis", None)
+    monkeypatch.setitem(sys.modules, "redis.asyncio", None)
+    with pytest.raises(RuntimeError):
+        ratelimit.RateLimiter([], backend_url="redis://localhost:6379").check_backend()
+    ratelimit.RateLimiter([]).check_backend()
+
+
+def test_photo_list_columnar_formats(client):
+    """Test compact photo list encodings selected through Accept"""
+    album = client.post("/api/albums", json={"name": "Columnar Album"}).json()
+    photo = client.post(
+        "/api/photos/upload",
+        files={"file": ("columnar.jpg", b"columnar", "image/jpeg")}
+    ).json()
+    client.post(f"/api/albums/{album['id']}/photos", json={"photo_ids": [photo["id"]]})
+
+    response = client.get("/api/photos", headers={"Accept": "application/vnd.home.columnar+json"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/vnd.home.columnar+json"
+    data = response.json()
+    assert data["count"] == len(data["columns"]["id"]) == len(client.get("/api/photos").json())
+    index = data["columns"]["id"].index(photo["id"])
+    assert data["columns"]["original_name"][index] == "columnar.jpg"
+    assert isinstance(data["columns"]["uploaded_at"][index], int)
+    assert response.headers["vary"] == "Accept"
+    assert client.get("/api/photos").headers["vary"] == "Accept"
+
+    response = client.get(f"/api/albums/{album['id']}/photos", headers={"Accept": "application/x-msgpack"})
+    if response.headers["content-type"] == "application/x-msgpack":
+        msgpack = pytest.importorskip("msgpack")
+        data = msgpack.unpackb(response.content)
+        assert data["columns"]["id"] == [photo["id"]]
+
+    response = client.get(f"/api/albums/{album['id']}/photos")
+    assert [p["id"] for p in response.json()] == [photo["id"]]
+    assert client.get("/api/albums/99999/photos").status_code == 404
+
+    # q values are honoured: q=0 rules a type out, the highest q wins
+    negotiate = encoding.negotiate
+    assert negotiate("application/x-msgpack;q=0, application/json") == "application/json"
+    assert negotiate("application/json;q=0.5, application/vnd.home.columnar+json") == "application/vnd.home.columnar+json"
+    assert negotiate("application/vnd.home.columnar+json;q=0.2, */*;q=0.8") == "application/json"
+    assert negotiate("application/vnd.home.columnar+json;q=0") == "application/json"
+
+
+def test_photo_timeline_and_cursor(client):
+    """Test timeline buckets and jumping to a month through its cursor"""
+    before = {(b["year"], b["month"]): b["count"] for b in client.get("/api/photos/timeline").json()["buckets"]}
+    ids = [
+        client.post("/api/photos/upload", files={"file": (f"t{i}.jpg", b"t", "image/jpeg")}).json()["id"]
+        for i in range(3)
+    ]
+    now = datetime.now()
+    after = {(b["year"], b["month"]): b["count"] for b in client.get("/api/photos/timeline").json()["buckets"]}
+    assert after[(now.year, now.month)] == before.get((now.year, now.month), 0) + 3
+
+    # Move two photos back to June 2019 and repair the buckets
+    db = TestingSessionLocal()
+    try:
+        for photo_id, day in zip(ids[:2], (10, 20)):
+            db.query(Photo).filter(Photo.id == photo_id).update({"taken_at": datetime(2019, 6, day)})
+        db.commit()
+        timeline.rebuild(db)
+    finally:
+        db.close()
+
+    data = client.get("/api/photos/timeline").json()
+    assert data["total"] == len(client.get("/api/photos").json())
+    june = next(b for b in data["buckets"] if (b["year"], b["month"]) == (2019, 6))
+    assert june["count"] == 2
+
+    response = client.get("/api/photos", params={"cursor": june["cursor"], "limit": 1})
+    assert [p["id"] for p in response.json()] == [ids[1]]
+    response = client.get("/api/photos", params={"cursor": response.headers["x-next-cursor"], "limit": 5})
+    assert [p["id"] for p in response.json()] == [ids[0]]
+    assert "x-next-cursor" not in response.headers
+
+    assert client.get("/api/photos", params={"cursor": "garbage!"}).status_code == 400
+
+
+def test_timeline_uses_capture_time(client, tmp_path):
+    """Test photos are placed by EXIF DateTimeOriginal, on upload and by the backfill"""
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif.get_ifd(0x8769)[0x9003] = "2018:03:14 15:09:26"
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, format="JPEG", exif=exif)
+
+    photo = client.post("/api/photos/upload", files={"file": ("old.jpg", buffer.getvalue(), "image/jpeg")}).json()
+    assert photo["taken_at"] == "2018-03-14T15:09:26"
+    buckets = client.get("/api/photos/timeline").json()["buckets"]
+    march = next(b for b in buckets if (b["year"], b["month"]) == (2018, 3))
+    assert march["count"] == 1
+    page = client.get("/api/photos", params={"cursor": march["cursor"], "limit": 1}).json()
+    assert [p["id"] for p in page] == [photo["id"]]
+
+    # A photo stored before capture times were read sits at its upload time until the backfill
+    path = tmp_path / "legacy.jpg"
+    path.write_bytes(buffer.getvalue())
+    db = TestingSessionLocal()
+    try:
+        uploaded = datetime(2025, 9, 1)
+        legacy = Photo(filename="legacy.jpg", original_name="legacy.jpg", file_path=str(path),
+                       uploaded_at=uploaded, taken_at=uploaded)
+        db.add(legacy)
+        db.commit()
+        assert timeline.backfill(db) == 1
+        db.refresh(legacy)
+        assert legacy.taken_at == datetime(2018, 3, 14, 15, 9, 26)
+        assert timeline.backfill(db) == 0
+    finally:
+        db.close()
+    buckets = client.get("/api/photos/timeline").json()["buckets"]
+    assert next(b for b in buckets if (b["year"], b["month"]) == (2018, 3))["count"] == 2
+
+
+def test_delete_photo(client):
+    """Test photo deletion detaches albums and removes files in the background"""
+    photo = client.post("/api/photos/upload", files={"file": ("gone.jpg", b"gone", "image/jpeg")}).json()
+    album = client.post("/api/albums", json={"name": "Delete Album"}).json()
+    client.post(f"/api/albums/{album['id']}/photos", json={"photo_ids": [photo["id"]]})
+    client.put(f"/api/albums/{album['id']}", json={"cover_photo_id": photo["id"]})
+    path = os.path.join(main.PHOTOS_DIR, photo["filename"])
+    assert os.path.exists(path)
+
+    response = client.delete(f"/api/photos/{photo['id']}")
+    assert response.status_code == 200
+    assert response.json()["ok"] == True
+
+    assert photo["id"] not in [p["id"] for p in client.get("/api/photos").json()]
+    album_data = client.get(f"/api/albums/{album['id']}").json()
+    assert album_data["photos"] == []
+    assert album_data["cover_photo_id"] is None
+    assert not os.path.exists(path)
+    assert client.delete(f"/api/photos/{photo['id']}").status_code == 404
+
+
+def test_bulk_delete_photos(client):
+    """Test bulk photo deletion skips unknown ids and updates the timeline"""
+    ids = [
+        client.post("/api/photos/upload", files={"file": (f"b{i}.jpg", b"b", "image/jpeg")}).json()["id"]
+        for i in range(2)
+    ]
+    total = client.get("/api/photos/timeline").json()["total"]
+
+    response = client.request("DELETE", "/api/photos", json={"photo_ids": ids + [99999]})
+    assert response.status_code == 200
+    assert sorted(response.json()["deleted_ids"]) == sorted(ids)
+    assert client.get("/api/photos/timeline").json()["total"] == total - 2
+
+
+def test_delete_album_removes_associations(client):
+    """Test album deletion leaves no photo_albums rows behind"""
+    photo = client.post("/api/photos/upload", files={"file": ("kept.jpg", b"kept", "image/jpeg")}).json()
+    album = client.post("/api/albums", json={"name": "Short Lived"}).json()
+    client.post(f"/api/albums/{album['id']}/photos", json={"photo_ids": [photo["id"]]})
+    assert client.delete(f"/api/albums/{album['id']}").status_code == 200
+
+    db = TestingSessionLocal()
+    try:
+        rows = db.execute(photo_albums.select().where(photo_albums.c.album_id == album["id"])).all()
+    finally:
+        db.close()
+    assert rows == []
+
+
+def test_sweep_orphans(client, tmp_path):
+    """Test the sweeper removes stale temp files and unreferenced files only"""
+    db = TestingSessionLocal()
+    try:
+        db.add(Photo(filename="known.jpg", original_name="known.jpg", file_path=str(tmp_path / "known.jpg")))
+        # Poster written before a long transcode; its name is not stored yet
+        db.add(Photo(filename="slow.mp4", original_name="slow.mp4", file_path=str(tmp_path / "slow.mp4"),
+                     media_type="video", processing_status="processing"))
+        db.commit()
+        names = ("known.jpg", "orphan.jpg", "tmp_abc", "fresh.jpg", "slow.mp4", "slow_poster.jpg")
+        for name in names:
+            (tmp_path / name).write_bytes(b"x")
+        os.mkdir(tmp_path / ".variants")
+        old = datetime(2020, 1, 1).timestamp()
+        for name in names:
+            if name != "fresh.jpg":
+                os.utime(tmp_path / name, (old, old))
+
+        assert sweeper.sweep_orphans(db, str(tmp_path), batch_size=10, min_age=3600) == 2
+        assert sorted(os.listdir(tmp_path)) == [".variants", "fresh.jpg", "known.jpg", "slow.mp4", "slow_poster.jpg"]
+    finally:
+        db.query(Photo).filter(Photo.filename.in_(("known.jpg", "slow.mp4"))).delete()
+        db.commit()
+        db.close()
+
+
+STARTUP_BUDGET_SECONDS = float(os.getenv("STARTUP_BUDGET_SECONDS", "8"))
+
+
+def test_import_is_side_effect_free(tmp_path):
+    """Test importing main neither creates the engine nor touches PHOTOS_DIR"""
+    photos_dir = tmp_path / "photos"
+    env = dict(os.environ, PHOTOS_DIR=str(photos_dir))
+    result = subprocess.run(
+        [sys.executable, "-c", "import main; print(main.get_engine.cache_info().currsize)"],
+        cwd=profile_startup.BACKEND_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.split()[-1] == "0"
+    assert not photos_dir.exists()
+
+
+def test_time_to_first_healthy_response(tmp_path):
+    """Test a cold start answers /api/health within the startup budget"""
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{tmp_path / 'startup.db'}",
+        PHOTOS_DIR=str(tmp_path / "photos"),
+    )
+    timings = profile_startup.measure_startup(env)
+    assert (timings["status"], timings["database"]) == (200, "connected")
+    assert (tmp_path / "photos").is_dir()
+    assert timings["total"] < STARTUP_BUDGET_SECONDS, timings
+
+
+def test_geohash_cover():
+    """Test geohash encoding and bounding box cover cells"""
+    assert geo.encode(57.64911, 10.40744, 11) == "u4pruydqqvj"
+    bbox = (126.8, 37.4, 127.2, 37.7)
+    cells = geo.cover(bbox)
+    assert 0 < len(cells) <= geo.MAX_COVER_CELLS
+    for lat, lon in ((37.5665, 126.978), (37.4, 126.8), (37.7, 127.2)):
+        assert any(geo.encode(lat, lon).startswith(cell) for cell in cells)
+    assert geo.cover((-180, -90, 180, 90)) == []
+
+
+def test_photo_geo_clusters(client):
+    """Test geotagged photos are clustered inside the requested bbox"""
+    places = [(37.5665, 126.9780), (37.5670, 126.9790), (35.1796, 129.0756)]
+    ids = []
+    for i, (lat, lon) in enumerate(places):
+        photo = client.post("/api/photos/upload", files={"file": (f"geo{i}.jpg", b"geo", "image/jpeg")}).json()
+        response = client.put(f"/api/photos/{photo['id']}", json={"latitude": lat, "longitude": lon})
+        assert response.status_code == 200
+        assert response.json()["latitude"] == lat
+        ids.append(photo["id"])
+
+    # Zoomed out over Korea: Seoul photos share a cluster, Busan is separate
+    response = client.get("/api/photos/geo", params={"bbox": "124,33,131,39", "zoom": 6})
+    assert response.status_code == 200
+    clusters = sorted(response.json(), key=lambda c: -c["count"])
+    assert [c["count"] for c in clusters] == [2, 1]
+    assert clusters[1]["photo_id"] == ids[2]
+
+    # Only Seoul in view
+    response = client.get("/api/photos/geo", params={"bbox": "126.8,37.4,127.2,37.7", "zoom": 18})
+    assert sorted(c["photo_id"] for c in response.json()) == ids[:2]
+
+    assert client.get("/api/photos/geo", params={"bbox": "1,2,3", "zoom": 5}).status_code == 400
+    assert client.put(f"/api/photos/{ids[0]}", json={"latitude": 10}).status_code == 400
+
+
+def test_upload_reads_exif_location(client):
+    """Test GPS coordinates are read from EXIF on upload"""
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif.get_ifd(0x8825).update({1: "N", 2: (37.0, 33.0, 59.4), 3: "E", 4: (126.0, 58.0, 40.8)})
+    buffer = io.BytesIO()
+    Image.new("RGB", (8, 8)).save(buffer, format="JPEG", exif=exif)
+
+    photo = client.post("/api/photos/upload", files={"file": ("gps.jpg", buffer.getvalue(), "image/jpeg")}).json()
+    assert photo["latitude"] == pytest.approx(37.5665)
+    assert photo["longitude"] == pytest.approx(126.978)
+
+
+def test_backfill_locations(client, tmp_path):
+    """Test existing photos get their location from EXIF"""
+    Image = pytest.importorskip("PIL.Image")
+    exif = Image.Exif()
+    exif.get_ifd(0x8825).update({1: "S", 2: (33.0, 52.0, 4.0), 3: "E", 4: (151.0, 12.0, 36.0)})
+    Image.new("RGB", (8, 8)).save(tmp_path / "old.jpg", format="JPEG", exif=exif)
+    Image.new("RGB", (8, 8)).save(tmp_path / "nogps.jpg", format="JPEG")
+
+    db = TestingSessionLocal()
+    try:
+        old = Photo(filename="old.jpg", original_name="old.jpg", file_path=str(tmp_path / "old.jpg"))
+        db.add_all([old, Photo(filename="nogps.jpg", original_name="nogps.jpg", file_path=str(tmp_path / "nogps.jpg"))])
+        db.commit()
+
+        assert geo.backfill(db, batch_size=1) == 1
+        db.refresh(old)
+        assert (old.latitude, old.longitude) == (pytest.approx(-33.8678), pytest.approx(151.21))
+        assert old.geohash == geo.encode(old.latitude, old.longitude)
+        assert geo.backfill(db) == 0
+    finally:
+        db.query(Photo).filter(Photo.filename.in_(("old.jpg", "nogps.jpg"))).delete()
+        db.commit()
+        db.close()
+
+
+def test_bulk_album_operations(client):
+    """Test NDJSON bulk copy/move/remove/set_cover and export"""
+    first = client.post("/api/albums", json={"name": "Bulk A"}).json()["id"]
+    second = client.post("/api/albums", json={"name": "Bulk B"}).json()["id"]
+    ids = [
+        client.post("/api/photos/upload", files={"file": (f"bulk{i}.jpg", b"bulk", "image/jpeg")}).json()["id"]
+        for i in range(4)
+    ]
+    operations = [
+        {"op": "copy", "photo_ids": ids, "to": first},
+        {"op": "copy", "photo_ids": ids[:1], "to": first},
+        {"op": "move", "photo_ids": ids[:2], "from": first, "to": second},
+        {"op": "remove", "photo_ids": [ids[3]], "from": first},
+        {"op": "set_cover", "album_id": second, "photo_id": ids[0]},
+        {"op": "copy", "photo_ids": ids, "to": 99999},
+        {"op": "move", "photo_ids": ids},
+        # ids[3] was never in the first album, 4242 does not exist
+        {"op": "move", "photo_ids": [ids[3], 4242], "from": first, "to": second},
+        {"op": "copy", "photo_ids": [ids[2], 4242], "to": second},
+    ]
+    body = "\n".join(json.dumps(op) for op in operations) + "\nnot json\n"
+
+    response = client.post("/api/albums/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    result = response.json()
+    assert (result["applied"], result["failed"]) == (7, 5)
+    assert (result["added"], result["removed"], result["covers_set"]) == (7, 3, 1)
+    assert sorted(e["line"] for e in result["errors"]) == [6, 7, 8, 9, 10]
+    skipped = {e["line"]: e.get("photo_ids") for e in result["errors"]}
+    assert (skipped[8], skipped[9]) == ([ids[3], 4242], [4242])
+
+    album_a = client.get(f"/api/albums/{first}").json()
+    album_b = client.get(f"/api/albums/{second}").json()
+    assert sorted(p["id"] for p in album_a["photos"]) == [ids[2]]
+    assert sorted(p["id"] for p in album_b["photos"]) == ids[:3]
+    assert album_b["cover_photo_id"] == ids[0]
+
+    response = client.get("/api/albums/export")
+    assert response.status_code == 200
+    exported = [json.loads(line) for line in response.text.splitlines()]
+    assert {"op": "copy", "to": second, "photo_ids": ids[:3]} in exported
+    assert {"op": "set_cover", "album_id": second, "photo_id": ids[0]} in exported
+
+    # Replaying the export is idempotent
+    response = client.post("/api/albums/bulk", content=response.content)
+    assert response.json()["added"] == 0
+
+
+def test_backup_snapshot_restore(tmp_path, monkeypatch):
+    """Test incremental snapshots, verification, restore and pruning"""
+    db_url = f"sqlite:///{tmp_path / 'backup.db'}"
+    backup_engine = create_engine(db_url)
+    Base.metadata.create_all(bind=backup_engine)
+    photos_dir, dest = tmp_path / "photos", str(tmp_path / "backups")
+    photos_dir.mkdir()
+    for name, data in [("a.jpg", b"aaa"), ("b.jpg", b"bbb"), ("v.mp4", b"same"), ("v_web.mp4", b"same")]:
+        (photos_dir / name).write_bytes(data)
+    with sessionmaker(bind=backup_engine)() as db:
+        db.add_all([
+            Photo(filename=name, original_name=name, file_path=str(photos_dir / name))
+            for name in ("a.jpg", "b.jpg", "missing.jpg")
+        ])
+        db.add(Photo(filename="v.mp4", original_name="v.mp4", file_path=str(photos_dir / "v.mp4"),
+                     playback_filename="v_web.mp4"))
+        db.add(Photo(filename="gone.jpg", original_name="gone.jpg", file_path="", deleted_at=datetime.now()))
+        db.commit()
+    backup_engine.dispose()
+
+    first = backup.create_snapshot(db_url, str(photos_dir), dest, jobs=2)
+    assert sorted(first["files"]) == ["a.jpg", "b.jpg", "v.mp4", "v_web.mp4"]
+    # Identical content is stored once
+    assert (first["stats"]["copied"], first["stats"]["missing"]) == (3, ["missing.jpg"])
+
+    (photos_dir / "b.jpg").write_bytes(b"changed")
+    second = backup.create_snapshot(db_url, str(photos_dir), dest, jobs=2)
+    assert second["previous"] == first["id"]
+    assert (second["stats"]["copied"], second["stats"]["reused"]) == (1, 3)
+    assert backup.list_snapshots(dest) == [first["id"], second["id"]]
+    assert backup.verify_snapshot(dest, second, rehash=True) == []
+
+    target = tmp_path / "restore"
+    backup.restore_snapshot(dest, str(target), first["id"])
+    assert (target / "photos" / "b.jpg").read_bytes() == b"bbb"
+    assert (target / "db.sqlite3").exists()
+
+    # A failed run leaves no snapshot directory behind
+    monkeypatch.setattr(backup, "verify_snapshot", lambda *args, **kwargs: ["object corrupt: a.jpg"])
+    with pytest.raises(backup.BackupError):
+        backup.create_snapshot(db_url, str(photos_dir), dest, jobs=2)
+    monkeypatch.undo()
+    assert sorted(os.listdir(os.path.join(dest, "snapshots"))) == [first["id"], second["id"]]
+
+    # Pruning keeps the newest snapshot and only the objects it refers to
+    old_b = backup.object_path(dest, first["files"]["b.jpg"]["sha256"])
+    result = backup.prune_snapshots(dest, keep=1)
+    assert (result["snapshots"], result["objects"], result["bytes"]) == ([first["id"]], 1, 3)
+    assert not os.path.exists(old_b)
+    assert backup.list_snapshots(dest) == [second["id"]]
+    assert backup.verify_snapshot(dest, second, rehash=True) == []
+
+    with open(backup.object_path(dest, second["files"]["b.jpg"]["sha256"]), "wb") as f:
+        f.write(b"corrupt")
+    assert backup.verify_snapshot(dest, second, rehash=True) == ["object corrupt: b.jpg"]
+    with pytest.raises(backup.BackupError):
+        backup.restore_snapshot(dest, str(tmp_path / "restore2"))
@@ -0,0 +1,181 @@
+"""Year/month photo counts kept up to date on upload/delete, plus keyset cursors.
+
+Photos are placed on the timeline by capture time (`taken_at`: EXIF
+DateTimeOriginal, or the upload time when there is none). Photo lists are
+ordered by (taken_at DESC, id DESC). A cursor encodes a position in that
+order; the photos after it satisfy ``(taken_at, id) < (cursor_time,
+cursor_id)``, which the ix_photos_taken_at_id index answers directly.
+
+Photos uploaded before capture times were read get theirs with
+``python timeline.py backfill`` (see `backfill`).
+"""
+
+import argparse
+import base64
+from datetime import datetime
+from typing import Optional, Tuple
+
+from sqlalchemy import and_, delete, extract, func, insert, or_, select, update
+from sqlalchemy.orm import Session
+
+from models import Photo, PhotoTimeline
+
+
+def encode_cursor(taken_at: datetime, photo_id: int) -> str:
+    raw = f"{taken_at.isoformat()}|{photo_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """Raises ValueError for malformed cursors."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, _, photo_id = raw.partition("|")
+        return datetime.fromisoformat(timestamp), int(photo_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
+
+
+def after_cursor(cursor: str):
+    """Filter clause selecting the photos that come after `cursor`."""
+    taken_at, photo_id = decode_cursor(cursor)
+    return or_(
+        Photo.taken_at < taken_at,
+        and_(Photo.taken_at == taken_at, Photo.id < photo_id),
+    )
+
+
+def bucket_cursor(year: int, month: int) -> str:
+    """Cursor whose next page starts with the newest photo of year/month."""
+    start_of_next = datetime(year + month // 12, month % 12 + 1, 1)
+    return encode_cursor(start_of_next, 0)
+
+
+def bump(db: Session, taken_at: Optional[datetime], delta: int):
+    """Adjust the bucket for `taken_at` by `delta` within the caller's transaction."""
+    if taken_at is None:
+        return
+    key = {"year": taken_at.year, "month": taken_at.month}
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert as upsert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as upsert
+        stmt = upsert(PhotoTimeline).values(**key, count=delta)
+        db.execute(stmt.on_conflict_do_update(
+            index_elements=["year", "month"],
+            set_={"count": PhotoTimeline.count + delta},
+        ))
+        return
+    result = db.execute(
+        update(PhotoTimeline)
+        .where(PhotoTimeline.year == key["year"], PhotoTimeline.month == key["month"])
+        .values(count=PhotoTimeline.count + delta)
+    )
+    if result.rowcount == 0:
+        db.execute(insert(PhotoTimeline).values(**key, count=delta))
+
+
+def rebuild(db: Session):
+    """Recompute every bucket from the photos table (repairs any drift)."""
+    year = extract("year", Photo.taken_at)
+    month = extract("month", Photo.taken_at)
+    counts = select(year, month, func.count()).where(Photo.taken_at.isnot(None), Photo.deleted_at.is_(None))
+    rows = db.execute(counts.group_by(year, month)).all()
+    db.execute(delete(PhotoTimeline))
+    if rows:
+        db.execute(insert(PhotoTimeline), [
+            {"year": int(y), "month": int(m), "count": c} for y, m, c in rows
+        ])
+    db.commit()
+
+
+def buckets(db: Session) -> list:
+    """Non-empty buckets, newest first."""
+    rows = (
+        db.query(PhotoTimeline)
+        .filter(PhotoTimeline.count > 0)
+        .order_by(PhotoTimeline.year.desc(), PhotoTimeline.month.desc())
+        .all()
+    )
+    return [
+        {"year": r.year, "month": r.month, "count": r.count, "cursor": bucket_cursor(r.year, r.month)}
+        for r in rows
+    ]
+
+
+def exif_capture_time(path: str) -> Optional[datetime]:
+    """DateTimeOriginal (or DateTimeDigitized) from a photo's EXIF, or None."""
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    try:
+        with Image.open(path) as img:
+            exif = img.getexif().get_ifd(0x8769)  # Exif IFD
+    except Exception:
+        return None
+    for tag in (0x9003, 0x9004):  # DateTimeOriginal, DateTimeDigitized
+        value = exif.get(tag)
+        if not isinstance(value, str):
+            continue
+        try:
+            return datetime.strptime(value.strip("\x00 ")[:19], "%Y:%m:%d %H:%M:%S")
+        except ValueError:
+            continue
+    return None
+
+
+def backfill(db: Session, batch_size: int = 500) -> int:
+    """Read EXIF capture times for images still placed at their upload time.
+
+    Rows are walked in id order and committed per batch; the buckets are
+    rebuilt at the end. Returns the number of photos that moved.
+    """
+    moved, last_id = 0, 0
+    while True:
+        photos = (
+            db.query(Photo)
+            .filter(
+                Photo.id > last_id,
+                or_(Photo.taken_at.is_(None), Photo.taken_at == Photo.uploaded_at),
+                Photo.media_type == "image",
+                Photo.deleted_at.is_(None),
+            )
+            .order_by(Photo.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not photos:
+            break
+        for photo in photos:
+            taken_at = exif_capture_time(photo.file_path)
+            if taken_at and taken_at != photo.taken_at:
+                photo.taken_at = taken_at
+                moved += 1
+            elif photo.taken_at is None:
+                photo.taken_at = photo.uploaded_at
+        last_id = photos[-1].id
+        db.commit()
+    rebuild(db)
+    return moved
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Photo timeline maintenance")
+    parser.add_argument("command", choices=["backfill", "rebuild"])
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    from main import db_session
+    with db_session() as db:
+        if args.command == "backfill":
+            print(f"Read capture times for {backfill(db, args.batch_size)} photos")
+        else:
+            rebuild(db)
+            print("Rebuilt timeline buckets")
+
+
+if __name__ == "__main__":
+    main()
@@ -26,6 +26,18 @@ class ApiClient {
     this.baseUrl = baseUrl;
   }
 
+  // Retry requests rejected with 429, waiting as long as the server's Retry-After asks
+  private async fetchWithRetry(url: string, init: () => RequestInit, attempts = 5): Promise<Response> {
+    for (let attempt = 1; ; attempt++) {
+      const response = await fetch(url, init());
+      if (response.status !== 429 || attempt >= attempts) {
+        return response;
+      }
+      const retryAfter = Number(response.headers.get('Retry-After')) || 1;
+      await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+    }
+  }
+
   private async handleResponse<T>(response: Response): Promise<T> {
     if (!response.ok) {
       const errorText = await response.text();
@@ -47,12 +59,10 @@ class ApiClient {
   }
 
   async uploadPhoto(file: File): Promise<Photo> {
-    const formData = new FormData();
-    formData.append('file', file);
-    
-    const response = await fetch(`${this.baseUrl}/api/photos/upload`, {
-      method: 'POST',
-      body: formData,
+    const response = await this.fetchWithRetry(`${this.baseUrl}/api/photos/upload`, () => {
+      const formData = new FormData();
+      formData.append('file', file);
+      return { method: 'POST', body: formData };
     });
     return this.handleResponse(response);
   }
@@ -4,7 +4,13 @@ export interface Photo {
   original_name: string;
   file_size: number;
   mime_type: string;
+  media_type: 'image' | 'video';
+  duration?: number | null;
+  playback_filename?: string | null;
+  poster_filename?: string | null;
+  processing_status?: 'pending' | 'processing' | 'ready' | 'failed' | null;
   uploaded_at: string;
+  taken_at?: string | null;
   description?: string;
 }
 